@@ -1,148 +1,260 @@
-from flask import Flask, request, jsonify
-from eth_interaction import send_transaction
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from eth_interaction import send_raw_transaction
+from game_room import GameError
+from fhe_executor import ExecutorBusy, JobFailed
+from serialization import content_type_for, ser_type_from_content_type
 from openfhe import *
-import tempfile
-import os
+from concurrent.futures import TimeoutError as JobTimeout
+import game_service as service
+from game_service import context_pool, fhe, fhe_job_timeout, rooms
+import metrics
+import time
 
 app = Flask(__name__)
 
-player_state = {
-    'is_seeker': True,
-    'position_xy': None, #encrypted length 2 vector
-}
-
-game_state = {
-    'players': [player_state],
-    'current_stage': 1,
-    'current_turn': 1,
-    'is_decryption_stage': False, 
-    'partial_decryptions': [],
-    'crypto_context': None,
-    'public_key': None
-}
-
-max_players = 2
-max_stage = 10
-tile_size = 10
-serType = JSON 
-datafolder = "demodata"
-
-def create_crypto_context():
-    parameters = CCParamsBGVRNS()
-    parameters.SetPlaintextModulus(65537)
-    parameters.SetMultipartyMode(NOISE_FLOODING_MULTIPARTY)
-
-    cc = GenCryptoContext(parameters)
-    cc.Enable(PKE)
-    cc.Enable(KEYSWITCH)
-    cc.Enable(LEVELEDSHE)
-    cc.Enable(ADVANCEDSHE)
-    cc.Enable(MULTIPARTY)
-    return cc
-
-def create_game():
-    game_state['crypto_context'] = create_crypto_context()
-
-    cc = game_state['crypto_context']
-    kp1 = cc.KeyGen()
-    kp2 = cc.MultipartyKeyGen(kp1.publicKey)
-
-    if not kp1.good():
-        return jsonify({'error': 'Key generation failed'}), 399
-    if not kp2.good():
-        return jsonify({'error': 'Key generation failed'}), 399
-
-    game_state['public_key'] = kp2.publicKey
-
-    if not SerializeToFile(datafolder + "/cryptocontext.txt", cc, serType):
-        raise Exception(
-            "Error writing serialization of the crypto context to cryptocontext.txt"
-        )
-    if not SerializeToFile(datafolder + "/key-public.txt", kp2.publicKey, serType):
-        raise Exception(
-            "Error writing serialization of the public key to key-public.txt"
-        )
-    print("The cryptocontext has been serialized.")
-
-create_game() 
+def create_game(room):
+    try:
+        crypto = context_pool.acquire()
+        fhe.run('load_game', *service.load_game_args(room, crypto), game_id=room.game_id, block=True,
+                timeout=fhe_job_timeout)
+    except (RuntimeError, JobFailed, JobTimeout) as e:
+        # A timed out load may still finish on the worker; the drop runs after it.
+        fhe.submit('drop_game', game_id=room.game_id, block=True)
+        raise service.game_failed(room, e)
+    service.start_game(room, crypto)
+
+def finish_game(room):
+    service.finish_game(room)
+    fhe.submit('drop_game', game_id=room.game_id, block=True)
+
+def serve_payload(payload, kind):
+    status, headers, body = payload.serve(request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
+    return Response(service.record_sent(body, kind), status=status, headers=headers)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.request_seconds.labels(route, request.method, response.status_code).observe(time.perf_counter() - g.started)
+    return response
+
+@app.errorhandler(GameError)
+def handle_game_error(error):
+    return jsonify({'error': error.message}), error.status
+
+@app.errorhandler(ExecutorBusy)
+def handle_executor_busy(error):
+    return jsonify({'error': str(error)}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(JobFailed)
+def handle_job_failed(error):
+    return jsonify({'error': 'FHE job failed'}), 500
+
+@app.errorhandler(JobTimeout)
+def handle_job_timeout(error):
+    return jsonify({'error': 'FHE job timed out'}), 504
 
 @app.route('/join', methods=['POST'])
 def join_game():
-    if len(game_state['players']) >= max_players:
-        return jsonify({'error': 'Game is already full'}), 399
-
     player_address = request.json.get('address')
     if not player_address:
         return jsonify({'error': 'No address provided'}), 399
 
-    game_state['players'].append(player_address)
-    player_id = len(game_state['players'])
-
-    if len(game_state['players']) == 2:
-        create_game()
-
-    return jsonify({'message': f'Player {player_id} joined', 'player_id': player_id})
+    game_id = request.json.get('game_id')
+    while True:
+        room = service.room_for_join(game_id)
+        with room.lock:
+            player_id = service.seat(room, player_address, game_id)
+            if player_id is None:
+                continue
+            if room.is_full():
+                create_game(room)
+        break
+
+    return jsonify(service.join_response(room, player_id))
+
+def read_move_request():
+    """Return (game_id, player_id, payload, ser_type) from any of the supported /move encodings.
+
+    Binary clients send the ciphertext as the raw request body (or as a
+    multipart 'ciphertext' file) with game_id and player_id in the query
+    string; JSON clients keep sending everything inside the JSON body.
+    """
+    if request.mimetype == 'application/octet-stream':
+        return request.args.get('game_id'), request.args.get('player_id', type=int), request.get_data(), BINARY
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('ciphertext')
+        ser_type = ser_type_from_content_type(upload.mimetype) if upload else BINARY
+        return request.form.get('game_id'), request.form.get('player_id', type=int), upload.read() if upload else None, ser_type
+
+    body = request.get_json(silent=True) or {}
+    return body.get('game_id'), body.get('player_id'), body.get('ciphertext'), JSON
 
 @app.route('/move', methods=['POST'])
 def process_move():
-    player_id = request.json.get('player_id')
-    if current_turn != player_id:
-        return jsonify({'error': 'Not your turn'}), 400
-    ciphertext_json = request.json.get('ciphertext')
-    if not player_id or not ciphertext_json:
-        return jsonify({'error': 'No player_id or ciphertext provided'}), 400
-
-    cc = game_state['crypto_context']
-
-    ciphertext = cc.Deserialize(ciphertext_json, serType)
-    if not ciphertext:
-        return jsonify({'error': 'Failed to deserialize ciphertext'}), 400
-
-    if game_state['player_states'][player_id - 1] is None:
-        game_state['player_states'][player_id - 1] = ciphertext
-    else:
-        game_state['player_states'][player_id - 1] = cc.EvalAdd(game_state['player_states'][player_id - 1], ciphertext)
-
-    game_state['current_turn'] = (game_state['current_turn'] + 1) % (max_players + 1)
-    if game_state['current_turn'] == 0:
-        game_state['is_decryption_stage'] = True
-
-        game_state['current_stage'] += 1
-        game_state['current_turn'] = 1
-    
-    if game_state[max_stage] == game_state['current_stage']:
-        return jsonify({'message': 'Hiders won!'}), 200
-
-    return jsonify({'message': f'Player {player_id} moved'})
-
-@app.route('/get_pubkey', methods=['GET'])
-def get_public_key():
-    if not game_state['public_key']:
-        return jsonify({'error': 'Public key not generated yet'}), 400
-
-    public_key_str = str(game_state['public_key'])  
-    print("The public key has been serialized.")
-    return jsonify({'public_key': public_key_str})
-
-@app.route('/get_crypto_context', methods=['GET'])
-def get_crypto_context():
-    if not game_state['crypto_context']:
-        return jsonify({'error': 'Crypto context not generated yet'}), 400
-
-    crypto_context_json = game_state['crypto_context'].Serialize("JSON")
-    if not crypto_context_json:
-        return jsonify({'error': 'Failed to serialize crypto context'}), 400
-
-    return jsonify(crypto_context_json)
+    game_id, player_id, payload, payload_ser_type = read_move_request()
+    service.require('No game_id, player_id or ciphertext provided', game_id, player_id, payload)
+
+    room = rooms.get(game_id)
+    with room.lock:
+        service.check_move(room, player_id)
+
+        # Waiting here only holds this room's lock; the work runs on the room's worker.
+        deserialize_seconds = fhe.run('push_move', *service.push_move_args(room, player_id, payload, payload_ser_type),
+                                      game_id=game_id, timeout=fhe_job_timeout)
+        if service.record_move(room, player_id, payload, payload_ser_type, deserialize_seconds):
+            # Same worker, so it runs before any later move or share of this game.
+            inputs = fhe.submit('fold_moves', *service.fold_args(), game_id=game_id, block=True)
+            service.start_decryption(room, inputs)
+
+    if room.finished:
+        finish_game(room)
+    return jsonify(service.move_response(room, player_id))
+
+@app.route('/get_pubkey/<game_id>', methods=['GET'])
+def get_public_key(game_id):
+    return serve_payload(service.crypto_payload(rooms.get(game_id), 'public_key'), 'public_key')
+
+@app.route('/get_crypto_context/<game_id>', methods=['GET'])
+def get_crypto_context(game_id):
+    return serve_payload(service.crypto_payload(rooms.get(game_id), 'crypto_context'), 'crypto_context')
+
+@app.route('/get_game_state/<game_id>', methods=['GET'])
+def get_game_state(game_id):
+    return jsonify(rooms.get(game_id).state_for())
+
+@app.route('/events/<game_id>', methods=['GET'])
+def game_events(game_id):
+    """Server-Sent Events stream of the room's state, pushed on every join, turn and decryption change.
+
+    Each event carries the full public state, so a client that reconnects with
+    Last-Event-ID only needs the latest one. The stream ends with the game.
+    """
+    room = rooms.get(game_id)
+    seen = request.headers.get('Last-Event-ID', -1, type=int)
+
+    def stream():
+        metrics.event_streams.inc()
+        try:
+            version, event, state = seen, None, None
+            with room.lock:
+                if room.version > version:
+                    version, event, state = room.version, room.last_event or 'state', room.state_for()
+            # Yield outside the lock: a slow client must not hold up the room.
+            if event is not None:
+                yield service.event_message(version, event, state)
+            while not room.finished:
+                version, event, state = room.wait_for_change(version, service.event_keepalive)
+                if event is None:
+                    yield service.keepalive_message
+                    continue
+                yield service.event_message(version, event, state)
+        finally:
+            metrics.event_streams.dec()
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/get_key_share/<game_id>/<int:player_id>', methods=['GET'])
+def get_key_share(game_id, player_id):
+    share = service.key_share(rooms.get(game_id), player_id, request.headers.get('X-Player-Token'))
+    return Response(share, mimetype=content_type_for(service.serType))
+
+@app.route('/get_decryption_input/<game_id>/<int:stage>/<int:index>', methods=['GET'])
+def get_decryption_input(game_id, stage, index):
+    room = rooms.get(game_id)
+    with room.lock:
+        inputs, input_payloads = service.open_decryption_round(room, stage)
+    inputs = inputs.result(fhe_job_timeout) if index not in input_payloads else None
+    return serve_payload(service.decryption_input(input_payloads, index, inputs), 'decryption_input')
+
+def read_decryption_request():
+    """Return (game_id, player_id, stage, shares, ser_type) from a multipart or JSON /decryption body.
+
+    A share holds one partial decryption per decryption input, in input order.
+    """
+    if request.mimetype == 'multipart/form-data':
+        uploads = request.files.getlist('partial_decryption')
+        ser_type = ser_type_from_content_type(uploads[0].mimetype) if uploads else BINARY
+        return (request.form.get('game_id'), request.form.get('player_id', type=int), request.form.get('stage', type=int),
+                [upload.read() for upload in uploads], ser_type)
+
+    body = request.get_json(silent=True) or {}
+    shares = body.get('partial_decryption')
+    if isinstance(shares, str):
+        shares = [shares]
+    return body.get('game_id'), body.get('player_id'), body.get('stage'), shares, JSON
+
+@app.route('/decryption', methods=['POST'])
+def decryption():
+    game_id, player_id, stage, shares, shares_ser_type = read_decryption_request()
+    service.require('No game_id, player_id, stage or partial_decryption provided', game_id, player_id, stage, shares)
+    service.record_shares(shares)
+
+    room = rooms.get(game_id)
+    with room.lock:
+        decryption_round = service.check_share(room, stage, player_id)
+        accepted = fhe.run('push_share', *service.push_share_args(stage, player_id, shares, shares_ser_type),
+                           game_id=game_id, timeout=fhe_job_timeout)
+        if not service.add_share(decryption_round, player_id, accepted):
+            return jsonify(service.share_response(decryption_round, player_id))
+
+        try:
+            values = fhe.run('fuse_shares', stage, 1, game_id=game_id, timeout=fhe_job_timeout)
+        except (JobFailed, JobTimeout):
+            decryption_round.withdraw_share(player_id)
+            raise
+        service.publish_decryption(room, decryption_round, values)
+
+    if room.finished:
+        finish_game(room)
+    return jsonify(service.decryption_response(room, decryption_round))
+
+@app.route('/decryption_result/<game_id>/<int:stage>', methods=['GET'])
+def decryption_result(game_id, stage):
+    """Long-poll for a stage's fused result; `wait` is how many seconds to block for it."""
+    wait = min(request.args.get('wait', 0, type=float), service.decryption_wait_limit)
+
+    room = rooms.get(game_id)
+    decryption_round = service.get_decryption_round(room, stage)
+    if not decryption_round.done.wait(wait):
+        return jsonify(service.pending_response(decryption_round)), 202
+
+    return jsonify(service.decryption_response(room, decryption_round))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+@app.route('/metrics/context_pool', methods=['GET'])
+def context_pool_metrics():
+    return jsonify(context_pool.metrics())
+
+@app.route('/metrics/fhe_executor', methods=['GET'])
+def fhe_executor_metrics():
+    return jsonify(fhe.stats())
+
+@app.route('/metrics/turns', methods=['GET'])
+def turn_metrics():
+    return jsonify(service.turn_report())
+
+@app.route('/metrics/settlement', methods=['GET'])
+def settlement_metrics():
+    return jsonify(service.settlement_report())
+
+@app.route('/metrics/serialization', methods=['GET'])
+def serialization_metrics():
+    return jsonify(service.serialization_report())
 
 @app.route('/send_transaction', methods=['POST'])
 def transaction():
-    transaction_data = request.json.get('transaction')
-    if not transaction_data:
-        return jsonify({'error': 'No transaction data provided'}), 400
-
-    tx_hash = send_transaction(transaction_data)
+    tx_hash = send_raw_transaction(service.read_transaction(request.json))
     return jsonify({'transaction_hash': tx_hash})
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # The reloader would start a second process with its own FHE workers and context pool.
+    app.run(debug=True, use_reloader=False)
@@ -0,0 +1,366 @@
+"""The game API on ASGI, for uvicorn.
+
+Same routes as app.py and the same game logic (game_service.py), but every
+route is a coroutine on one event loop. OpenFHE work is still done by the
+FheExecutor worker processes: routes await the executor's futures instead of
+blocking a thread on them, so state, key and transaction requests are never
+queued behind crypto. Rooms are serialized by an asyncio lock per room, and SSE
+subscribers and long-polls wait on an asyncio condition instead of holding a
+thread each.
+
+Rooms live in this process, so run a single uvicorn worker and scale the FHE
+side with FHE_WORKERS:
+
+    uvicorn asgi_app:app --workers 1 --port 5000
+"""
+import asyncio
+import time
+import weakref
+from concurrent.futures import TimeoutError as JobTimeout
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from openfhe import *
+
+from eth_interaction import get_gateway
+from fhe_executor import ExecutorBusy, JobFailed
+from game_room import GameError
+import game_service as service
+from game_service import context_pool, fhe, fhe_job_timeout, rooms
+import metrics
+from serialization import content_type_for, ser_type_from_content_type
+
+
+app = FastAPI()
+
+
+class RoomSync:
+    """Event loop side of a room: its lock and the condition SSE streams and long-polls wait on."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.changed = asyncio.Condition()
+
+
+room_syncs = weakref.WeakKeyDictionary()  # GameRoom -> RoomSync, gone with the room
+
+
+def sync_for(room):
+    sync = room_syncs.get(room)
+    if sync is None:
+        sync = room_syncs[room] = RoomSync()
+    return sync
+
+
+async def wake(room):
+    """Wake the coroutines waiting on a room after game_service recorded an event on it."""
+    changed = sync_for(room).changed
+    async with changed:
+        changed.notify_all()
+
+
+async def fhe_submit(op, *args, game_id=None):
+    """Queue an FHE job and return its future; waiting for queue space happens off the loop."""
+    return await asyncio.to_thread(fhe.submit, op, *args, game_id=game_id, block=True)
+
+
+async def fhe_call(op, *args, game_id=None, block=False):
+    """Run an FHE job without blocking the event loop."""
+    future = await fhe_submit(op, *args, game_id=game_id) if block else fhe.submit(op, *args, game_id=game_id)
+    return await wait_job(future)
+
+
+async def wait_job(future):
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), fhe_job_timeout)
+    except asyncio.TimeoutError:
+        raise JobTimeout()
+
+
+async def create_game(room):
+    try:
+        crypto = await asyncio.to_thread(context_pool.acquire)
+        await fhe_call('load_game', *service.load_game_args(room, crypto), game_id=room.game_id, block=True)
+    except (RuntimeError, JobFailed, JobTimeout) as e:
+        # A timed out load may still finish on the worker; the drop runs after it.
+        await fhe_submit('drop_game', game_id=room.game_id)
+        raise service.game_failed(room, e)
+    service.start_game(room, crypto)
+
+
+async def finish_game(room):
+    service.finish_game(room)
+    await fhe_submit('drop_game', game_id=room.game_id)
+
+
+def error(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def serve_payload(request, payload, kind):
+    status, headers, body = payload.serve(request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
+    return Response(service.record_sent(body, kind), status_code=status, headers=headers)
+
+
+@app.middleware('http')
+async def record_request(request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    metrics.request_seconds.labels(route.path if route is not None else 'unmatched', request.method,
+                                   response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+@app.exception_handler(GameError)
+async def handle_game_error(request, exc):
+    return error(exc.message, exc.status)
+
+
+@app.exception_handler(ExecutorBusy)
+async def handle_executor_busy(request, exc):
+    return JSONResponse({'error': str(exc)}, status_code=503, headers={'Retry-After': '1'})
+
+
+@app.exception_handler(JobFailed)
+async def handle_job_failed(request, exc):
+    return error('FHE job failed', 500)
+
+
+@app.exception_handler(JobTimeout)
+async def handle_job_timeout(request, exc):
+    return error('FHE job timed out', 504)
+
+
+@app.post('/join')
+async def join_game(request: Request):
+    body = await request.json()
+    player_address = body.get('address')
+    if not player_address:
+        return error('No address provided', 399)
+
+    game_id = body.get('game_id')
+    while True:
+        room = service.room_for_join(game_id)
+        async with sync_for(room).lock:
+            player_id = service.seat(room, player_address, game_id)
+            if player_id is None:
+                continue
+            try:
+                if room.is_full():
+                    await create_game(room)
+            finally:
+                await wake(room)
+        break
+
+    return service.join_response(room, player_id)
+
+
+async def read_move_request(request):
+    """Return (game_id, player_id, payload, ser_type) from any of the supported /move encodings."""
+    mimetype = request.headers.get('Content-Type', '').split(';')[0].strip()
+    if mimetype == 'application/octet-stream':
+        player_id = request.query_params.get('player_id')
+        return (request.query_params.get('game_id'), int(player_id) if player_id else None,
+                await request.body(), BINARY)
+    if mimetype == 'multipart/form-data':
+        form = await request.form()
+        upload = form.get('ciphertext')
+        ser_type = ser_type_from_content_type(upload.content_type) if upload else BINARY
+        player_id = form.get('player_id')
+        return (form.get('game_id'), int(player_id) if player_id else None,
+                await upload.read() if upload else None, ser_type)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    return body.get('game_id'), body.get('player_id'), body.get('ciphertext'), JSON
+
+
+@app.post('/move')
+async def process_move(request: Request):
+    game_id, player_id, payload, payload_ser_type = await read_move_request(request)
+    service.require('No game_id, player_id or ciphertext provided', game_id, player_id, payload)
+
+    room = rooms.get(game_id)
+    async with sync_for(room).lock:
+        service.check_move(room, player_id)
+
+        move = service.push_move_args(room, player_id, payload, payload_ser_type)
+        deserialize_seconds = await fhe_call('push_move', *move, game_id=game_id)
+        if service.record_move(room, player_id, payload, payload_ser_type, deserialize_seconds):
+            inputs = await fhe_submit('fold_moves', *service.fold_args(), game_id=game_id)
+            service.start_decryption(room, inputs)
+        await wake(room)
+
+    if room.finished:
+        await finish_game(room)
+    return service.move_response(room, player_id)
+
+
+@app.get('/get_pubkey/{game_id}')
+async def get_public_key(game_id: str, request: Request):
+    return serve_payload(request, service.crypto_payload(rooms.get(game_id), 'public_key'), 'public_key')
+
+
+@app.get('/get_crypto_context/{game_id}')
+async def get_crypto_context(game_id: str, request: Request):
+    return serve_payload(request, service.crypto_payload(rooms.get(game_id), 'crypto_context'), 'crypto_context')
+
+
+@app.get('/get_game_state/{game_id}')
+async def get_game_state(game_id: str):
+    return rooms.get(game_id).state_for()
+
+
+@app.get('/events/{game_id}')
+async def game_events(game_id: str, request: Request):
+    """Server-Sent Events stream of the room's state, as in app.py."""
+    room = rooms.get(game_id)
+    changed = sync_for(room).changed
+    try:
+        seen = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        seen = -1  # as Flask's type=int: a malformed id counts as none
+
+    async def stream():
+        metrics.event_streams.inc()
+        try:
+            version = seen
+            while True:
+                async with changed:
+                    try:
+                        await asyncio.wait_for(changed.wait_for(lambda: room.version > version),
+                                               service.event_keepalive)
+                        version, event, state = room.version, room.last_event or 'state', room.state_for()
+                    except asyncio.TimeoutError:
+                        event = None
+                # Yield outside the condition: a slow client must not hold up the room.
+                if event is None:
+                    yield service.keepalive_message
+                    continue
+                yield service.event_message(version, event, state)
+                if state['finished']:
+                    return
+        finally:
+            metrics.event_streams.dec()
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get('/get_key_share/{game_id}/{player_id}')
+async def get_key_share(game_id: str, player_id: int, request: Request):
+    share = service.key_share(rooms.get(game_id), player_id, request.headers.get('X-Player-Token'))
+    return Response(share, media_type=content_type_for(service.serType))
+
+
+@app.get('/get_decryption_input/{game_id}/{stage}/{index}')
+async def get_decryption_input(game_id: str, stage: int, index: int, request: Request):
+    room = rooms.get(game_id)
+    async with sync_for(room).lock:
+        inputs, input_payloads = service.open_decryption_round(room, stage)
+    inputs = await wait_job(inputs) if index not in input_payloads else None
+    return serve_payload(request, service.decryption_input(input_payloads, index, inputs), 'decryption_input')
+
+
+async def read_decryption_request(request):
+    """Return (game_id, player_id, stage, shares, ser_type) from a multipart or JSON /decryption body."""
+    if request.headers.get('Content-Type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        uploads = form.getlist('partial_decryption')
+        ser_type = ser_type_from_content_type(uploads[0].content_type) if uploads else BINARY
+        player_id, stage = form.get('player_id'), form.get('stage')
+        return (form.get('game_id'), int(player_id) if player_id else None, int(stage) if stage else None,
+                [await upload.read() for upload in uploads], ser_type)
+
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    shares = body.get('partial_decryption')
+    if isinstance(shares, str):
+        shares = [shares]
+    return body.get('game_id'), body.get('player_id'), body.get('stage'), shares, JSON
+
+
+@app.post('/decryption')
+async def decryption(request: Request):
+    game_id, player_id, stage, shares, shares_ser_type = await read_decryption_request(request)
+    service.require('No game_id, player_id, stage or partial_decryption provided', game_id, player_id, stage, shares)
+    service.record_shares(shares)
+
+    room = rooms.get(game_id)
+    async with sync_for(room).lock:
+        decryption_round = service.check_share(room, stage, player_id)
+        accepted = await fhe_call('push_share', *service.push_share_args(stage, player_id, shares, shares_ser_type),
+                                  game_id=game_id)
+        if not service.add_share(decryption_round, player_id, accepted):
+            return service.share_response(decryption_round, player_id)
+
+        try:
+            values = await fhe_call('fuse_shares', stage, 1, game_id=game_id)
+        except (JobFailed, JobTimeout):
+            decryption_round.withdraw_share(player_id)
+            raise
+        service.publish_decryption(room, decryption_round, values)
+        await wake(room)
+
+    if room.finished:
+        await finish_game(room)
+    return service.decryption_response(room, decryption_round)
+
+
+@app.get('/decryption_result/{game_id}/{stage}')
+async def decryption_result(game_id: str, stage: int, wait: float = 0):
+    """Long-poll for a stage's fused result; `wait` is how many seconds to block for it."""
+    room = rooms.get(game_id)
+    decryption_round = service.get_decryption_round(room, stage)
+    changed = sync_for(room).changed
+    try:
+        if decryption_round.result is None:
+            async with changed:
+                await asyncio.wait_for(changed.wait_for(lambda: decryption_round.result is not None),
+                                       min(wait, service.decryption_wait_limit))
+    except asyncio.TimeoutError:
+        return JSONResponse(service.pending_response(decryption_round), status_code=202)
+
+    return service.decryption_response(room, decryption_round)
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, headers={'Content-Type': content_type})
+
+
+@app.get('/metrics/context_pool')
+async def context_pool_metrics():
+    return context_pool.metrics()
+
+
+@app.get('/metrics/fhe_executor')
+async def fhe_executor_metrics():
+    return fhe.stats()
+
+
+@app.get('/metrics/turns')
+async def turn_metrics():
+    return service.turn_report()
+
+
+@app.get('/metrics/settlement')
+async def settlement_metrics():
+    return service.settlement_report()
+
+
+@app.get('/metrics/serialization')
+async def serialization_metrics():
+    return service.serialization_report()
+
+
+@app.post('/send_transaction')
+async def transaction(request: Request):
+    tx_hash = await get_gateway().send_raw_transaction_async(service.read_transaction(await request.json()))
+    return {'transaction_hash': tx_hash}
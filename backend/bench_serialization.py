@@ -0,0 +1,57 @@
+"""Compare the JSON and BINARY wire formats for /move ciphertexts.
+
+Encrypts a move vector the way frontend/main.py does, then reports the
+serialized size and the average deserialize time of each format.
+
+    python bench_serialization.py --iterations 200 --output serialization.json
+"""
+import argparse
+import json
+import time
+
+from context_pool import create_game_crypto
+from fhe_params import get_profile
+from serialization import deserialize_ciphertext, ser_types, serialize
+
+
+def measure(ciphertext, ser_type, iterations):
+    payload = serialize(ciphertext, ser_type)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        deserialize_ciphertext(payload, ser_type)
+    elapsed = time.perf_counter() - started
+
+    return {'bytes': len(payload), 'deserialize_seconds': elapsed / iterations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--profile', default='default', help='FHE parameter profile name or JSON overrides')
+    parser.add_argument('--output', help='also write the comparison as JSON to this file')
+    args = parser.parse_args()
+
+    crypto = create_game_crypto(get_profile(args.profile))
+    cc = crypto.crypto_context
+    ciphertext = cc.Encrypt(crypto.public_key, cc.MakePackedPlaintext([0, 1]))
+
+    results = {name: measure(ciphertext, ser_type, args.iterations) for name, ser_type in ser_types.items()}
+    results['binary_to_json'] = {
+        'size_ratio': results['binary']['bytes'] / results['json']['bytes'],
+        'deserialize_speedup': results['json']['deserialize_seconds'] / results['binary']['deserialize_seconds'],
+    }
+
+    print(f"{'format':<8} {'bytes':>10} {'deserialize (ms)':>18}")
+    for name in ser_types:
+        print(f"{name:<8} {results[name]['bytes']:>10} {results[name]['deserialize_seconds'] * 1000:>18.3f}")
+    print(f"binary is {results['binary_to_json']['size_ratio']:.2%} of the JSON size and deserializes "
+          f"{results['binary_to_json']['deserialize_speedup']:.1f}x faster")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
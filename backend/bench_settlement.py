@@ -0,0 +1,71 @@
+"""Exercise the settlement queue against an in-process test chain (eth-tester).
+
+Deploys a stand-in settlement contract that accepts any call, settles
+`--games` finished games through a SettlementQueue for each batch size, and
+compares the transactions, gas and wall time with one transaction per game.
+Duplicate submissions are mixed in to check the idempotency keys.
+
+    python bench_settlement.py --games 200 --batch-sizes 1 8 32 --json settlement.json
+"""
+import argparse
+import json
+import time
+
+from web3 import Web3
+
+from eth_interaction import EthGateway
+from settlement import SettlementQueue
+
+# Init code that deploys a one-byte runtime (STOP): every call to it succeeds.
+sink_contract = '0x6001600c60003960016000f300'
+
+
+def deploy_sink(w3):
+    tx_hash = w3.eth.sendTransaction({'from': w3.eth.accounts[0], 'data': sink_contract})
+    return w3.eth.waitForTransactionReceipt(tx_hash)['contractAddress']
+
+
+def run(games, batch_size, max_wait):
+    w3 = Web3(Web3.EthereumTesterProvider())
+    private_key = w3.provider.ethereum_tester.backend.account_keys[0].to_hex()
+    gateway = EthGateway(w3=w3)
+    contract = deploy_sink(w3)
+    start_block = w3.eth.blockNumber
+
+    queue = SettlementQueue(gateway, private_key, contract, max_batch=batch_size, max_wait=max_wait).start()
+    started = time.perf_counter()
+    for i in range(games):
+        queue.submit(f'game-{i}', 'seeker' if i % 2 else 'hider')
+        if i % 10 == 0:
+            queue.submit(f'game-{i}', 'hider')  # a retried finish must not settle twice
+    queue.stop()
+    elapsed = time.perf_counter() - started
+
+    gas = sum(w3.eth.getBlock(n, full_transactions=False)['gasUsed'] for n in range(start_block + 1, w3.eth.blockNumber + 1))
+    return dict(queue.metrics(), games=games, batch_size=batch_size, seconds=elapsed, gas_used=gas,
+                transactions=w3.eth.blockNumber - start_block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--max-wait', type=float, default=0.05, help='seconds before a partial batch is flushed')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        row = run(args.games, batch_size, args.max_wait)
+        rows.append(row)
+        print(f"batch={batch_size:<4} transactions={row['transactions']:<5} settled={row['settled']:<5} "
+              f"duplicates={row['duplicates']:<4} gas={row['gas_used']:<10} time={row['seconds']:.2f}s "
+              f"confirm avg={(row['confirm_latency_avg'] or 0) * 1000:.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
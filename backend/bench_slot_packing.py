@@ -0,0 +1,127 @@
+"""Games per second with one ciphertext per player versus players packed into shared slots.
+
+All three paths compute the same output: every player's position after each
+stage, folded from the stage's moves and threshold-decrypted with the dealt
+key shares (Lead, Main, Fusion).
+
+- one ciphertext per player: a MoveAccumulator per game, one decryption per player;
+- packed within a room: a game's players share one ciphertext, one decryption per game;
+- packed across rooms: every game shares one ciphertext, one decryption per stage.
+
+This is not the game's `fold_moves` path: a room only decrypts the hider-seeker
+proximity (EvalSub, EvalMult, EvalSum), never positions, and a packed
+ciphertext cannot compute it without rotation keys. Packing across rooms also
+needs every room under the same keys (see slot_packing.py). Encrypting the
+moves is client work and is done before timing.
+
+    python bench_slot_packing.py --games 256 --stages 2 --batch-size 4096 --output packing.json
+"""
+import argparse
+import json
+import time
+
+from context_pool import create_game_crypto
+from fhe_params import profiles
+from move_accumulator import MoveAccumulator
+from slot_packing import PackedMoveEngine, SlotLayout
+
+
+num_players = 2
+
+
+def threshold_decrypt(cc, key_pairs, ciphertext):
+    partials = [cc.MultipartyDecryptLead([ciphertext], key_pairs[0].secretKey)[0]]
+    partials += [cc.MultipartyDecryptMain([ciphertext], kp.secretKey)[0] for kp in key_pairs[1:]]
+    return cc.MultipartyDecryptFusion(partials)
+
+
+def run_per_game(crypto, moves, games, stages):
+    cc = crypto.crypto_context
+    accumulators = [MoveAccumulator(cc, num_players) for _ in range(games)]
+
+    started = time.perf_counter()
+    for stage in range(stages):
+        for game, accumulator in enumerate(accumulators):
+            for player in range(num_players):
+                accumulator.push(player, moves[stage][game][player])
+            for position in accumulator.fold():
+                threshold_decrypt(cc, crypto.key_pairs, position)
+    return time.perf_counter() - started
+
+
+def run_packed(crypto, engines, moves, stages):
+    """`moves[stage][i]` are the placed moves of `engines[i]`; each engine is decrypted once per stage."""
+    cc = crypto.crypto_context
+
+    started = time.perf_counter()
+    for stage in range(stages):
+        for engine, engine_moves in zip(engines, moves[stage]):
+            for move in engine_moves:
+                engine.push(move)
+            threshold_decrypt(cc, crypto.key_pairs, engine.fold())
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=256)
+    parser.add_argument('--stages', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    profile = profiles['default']._replace(name='packed', batch_size=args.batch_size)
+    crypto = create_game_crypto(profile)
+    cc, public_key = crypto.crypto_context, crypto.public_key
+
+    layout = SlotLayout(args.batch_size)
+    games = min(args.games, layout.capacity // num_players)
+    for game in range(games):
+        layout.assign(game, num_players)
+    room_layouts = [SlotLayout(args.batch_size) for _ in range(games)]
+    for room_layout in room_layouts:
+        room_layout.assign(0, num_players)
+
+    def encrypt(slots):
+        return cc.Encrypt(public_key, cc.MakePackedPlaintext(slots))
+
+    step = [1, 1]
+    per_game_moves = [[[encrypt(step) for _ in range(num_players)] for _ in range(games)] for _ in range(args.stages)]
+    within_moves = [[[encrypt(room_layout.place(step, 0, player)) for player in range(num_players)]
+                     for room_layout in room_layouts] for _ in range(args.stages)]
+    across_moves = [[[encrypt(layout.place(step, game, player)) for game in range(games) for player in range(num_players)]]
+                    for _ in range(args.stages)]
+
+    per_game_seconds = run_per_game(crypto, per_game_moves, games, args.stages)
+    within_seconds = run_packed(crypto, [PackedMoveEngine(cc, room_layout) for room_layout in room_layouts],
+                                within_moves, args.stages)
+    across_seconds = run_packed(crypto, [PackedMoveEngine(cc, layout)], across_moves, args.stages)
+
+    results = {
+        'games': games,
+        'stages': args.stages,
+        'batch_size': args.batch_size,
+        'ring_dimension': cc.GetRingDimension(),
+        'output': 'every player position per stage',
+        'per_game_games_per_second': games * args.stages / per_game_seconds,
+        'packed_within_room_games_per_second': games * args.stages / within_seconds,
+        'packed_across_rooms_games_per_second': games * args.stages / across_seconds,
+    }
+    results['within_room_speedup'] = results['packed_within_room_games_per_second'] / results['per_game_games_per_second']
+    results['across_rooms_speedup'] = results['packed_across_rooms_games_per_second'] / results['per_game_games_per_second']
+
+    print(f"{games} games x {args.stages} stages, {layout.capacity} player ranges per ciphertext; "
+          f"all paths decrypt every player's position")
+    print(f"one ciphertext per player:  {results['per_game_games_per_second']:10.1f} game-stages/s")
+    print(f"packed within a room:       {results['packed_within_room_games_per_second']:10.1f} game-stages/s "
+          f"({results['within_room_speedup']:.1f}x)")
+    print(f"packed across rooms:        {results['packed_across_rooms_games_per_second']:10.1f} game-stages/s "
+          f"({results['across_rooms_speedup']:.1f}x, shared keys only)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
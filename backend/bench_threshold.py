@@ -0,0 +1,191 @@
+"""Benchmark harness built from the scenarios in threshold-fhe.py.
+
+Runs the BGVrns, BFVrns and CKKS threshold flows of the demo for every
+combination of scheme, party count, batch size and serialization format, and
+times each phase on its own: key generation rounds, joint eval key rounds,
+encryption, EvalAdd/EvalMult/EvalSum, the Lead/Main partial decryptions and
+the fusion. The key rounds are the N-party ceremony the server runs
+(key_ceremony.py), with its per-party rounds on --ceremony-threads threads.
+Results are written as JSON and/or CSV for regression tracking and capacity
+planning.
+
+    python bench_threshold.py --schemes bgv bfv ckks --parties 2 3 4 --batch-sizes 16 1024 \\
+        --formats binary json --repeat 3 --json threshold.json --csv threshold.csv
+    python bench_threshold.py --schemes bgv --parties 2 4 6 8 --ceremony-threads 0 4 --json ceremony.json
+"""
+import argparse
+import csv
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openfhe import *
+
+from key_ceremony import run_key_ceremony
+from serialization import deserialize_ciphertext, ser_types, serialize
+
+
+def bgv_parameters(batch_size):
+    parameters = CCParamsBGVRNS()
+    parameters.SetPlaintextModulus(65537)
+    parameters.SetBatchSize(batch_size)
+    parameters.SetMultiplicativeDepth(2)
+    parameters.SetMultipartyMode(NOISE_FLOODING_MULTIPARTY)
+    return parameters
+
+
+def bfv_parameters(batch_size):
+    parameters = CCParamsBFVRNS()
+    parameters.SetPlaintextModulus(65537)
+    parameters.SetBatchSize(batch_size)
+    parameters.SetMultiplicativeDepth(2)
+    parameters.SetMultipartyMode(NOISE_FLOODING_MULTIPARTY)
+    return parameters
+
+
+def ckks_parameters(batch_size):
+    parameters = CCParamsCKKSRNS()
+    parameters.SetMultiplicativeDepth(3)
+    parameters.SetScalingModSize(50)
+    parameters.SetBatchSize(batch_size)
+    return parameters
+
+
+schemes = {
+    'bgv': (bgv_parameters, lambda cc, values: cc.MakePackedPlaintext(values)),
+    'bfv': (bfv_parameters, lambda cc, values: cc.MakePackedPlaintext(values)),
+    'ckks': (ckks_parameters, lambda cc, values: cc.MakeCKKSPackedPlaintext([float(v) for v in values])),
+}
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, phase, fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + time.perf_counter() - started
+        return value
+
+
+def threshold_decrypt(cc, key_pairs, ciphertext, timer):
+    partials = [timer('decrypt_lead', cc.MultipartyDecryptLead, [ciphertext], key_pairs[0].secretKey)[0]]
+    for kp in key_pairs[1:]:
+        partials.append(timer('decrypt_main', cc.MultipartyDecryptMain, [ciphertext], kp.secretKey)[0])
+    return timer('decrypt_fusion', cc.MultipartyDecryptFusion, partials)
+
+
+def run_scenario(scheme, parties, batch_size, ser_name, ceremony_threads=0):
+    make_parameters, encode = schemes[scheme]
+    timer = PhaseTimer()
+
+    cc = timer('context', GenCryptoContext, make_parameters(batch_size))
+    cc.Enable(PKE)
+    cc.Enable(KEYSWITCH)
+    cc.Enable(LEVELEDSHE)
+    cc.Enable(ADVANCEDSHE)
+    cc.Enable(MULTIPARTY)
+
+    if ceremony_threads:
+        with ThreadPoolExecutor(ceremony_threads) as executor:
+            ceremony = run_key_ceremony(cc, parties, executor)
+    else:
+        ceremony = run_key_ceremony(cc, parties)
+    timer.seconds.update(ceremony.timings)
+    key_pairs, public_key = ceremony.key_pairs, ceremony.public_key
+
+    values1 = [(i % 7) + 1 for i in range(batch_size)]
+    values2 = [(i % 3) for i in range(batch_size)]
+    ciphertext1 = timer('encrypt', cc.Encrypt, public_key, encode(cc, values1))
+    ciphertext2 = timer('encrypt', cc.Encrypt, public_key, encode(cc, values2))
+
+    ser_type = ser_types[ser_name]
+    payload = timer('serialize', serialize, ciphertext1, ser_type)
+    timer('deserialize', deserialize_ciphertext, payload, ser_type)
+
+    ciphertextAdd = timer('eval_add', cc.EvalAdd, ciphertext1, ciphertext2)
+    ciphertextMult = timer('eval_mult', cc.EvalMult, ciphertext1, ciphertext2)
+    if scheme == 'ckks':
+        ciphertextMult = timer('eval_mult', cc.ModReduce, ciphertextMult)
+    timer('eval_sum', cc.EvalSum, ciphertext2, batch_size)
+
+    plaintext = threshold_decrypt(cc, key_pairs, ciphertextAdd, timer)
+    threshold_decrypt(cc, key_pairs, ciphertextMult, timer)
+
+    plaintext.SetLength(batch_size)
+    if scheme == 'ckks':
+        decrypted = [round(v) for v in plaintext.GetRealPackedValue()]
+    else:
+        decrypted = list(plaintext.GetPackedValue())
+
+    return {
+        'scheme': scheme,
+        'parties': parties,
+        'ceremony_threads': ceremony_threads,
+        'batch_size': batch_size,
+        'format': ser_name,
+        'ring_dimension': cc.GetRingDimension(),
+        'ciphertext_bytes': len(payload),
+        'correct': decrypted == [a + b for a, b in zip(values1, values2)],
+        # Encryption and every decryption phase ran twice above; report them per operation.
+        **{f'{phase}_seconds': seconds for phase, seconds in timer.seconds.items()},
+        'decrypt_lead_seconds': timer.seconds['decrypt_lead'] / 2,
+        'decrypt_main_seconds': timer.seconds.get('decrypt_main', 0.0) / 2,
+        'decrypt_fusion_seconds': timer.seconds['decrypt_fusion'] / 2,
+        'encrypt_seconds': timer.seconds['encrypt'] / 2,
+    }
+
+
+def median_row(rows):
+    row = dict(rows[0])
+    for key, value in row.items():
+        if key.endswith('_seconds'):
+            row[key] = statistics.median(r[key] for r in rows)
+    row['correct'] = all(r['correct'] for r in rows)
+    row['repeat'] = len(rows)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--schemes', nargs='+', choices=sorted(schemes), default=sorted(schemes))
+    parser.add_argument('--parties', nargs='+', type=int, default=[2, 3])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[16])
+    parser.add_argument('--formats', nargs='+', choices=sorted(ser_types), default=['binary'])
+    parser.add_argument('--ceremony-threads', nargs='+', type=int, default=[0],
+                        help='threads for the per-party key rounds; 0 runs them sequentially')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per combination; the median is reported')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    parser.add_argument('--csv', help='write results as CSV to this file')
+    args = parser.parse_args()
+
+    results = []
+    for scheme in args.schemes:
+        for parties in args.parties:
+            for batch_size in args.batch_sizes:
+                for ser_name in args.formats:
+                    for threads in args.ceremony_threads:
+                        row = median_row([run_scenario(scheme, parties, batch_size, ser_name, threads)
+                                          for _ in range(args.repeat)])
+                        results.append(row)
+                        print(f"{scheme:<5} parties={parties:<2} batch={batch_size:<6} {ser_name:<6} threads={threads:<2} "
+                              f"keygen={row['keygen_seconds'] * 1000:8.1f}ms "
+                              f"evalkeys={(row['eval_mult_keys_seconds'] + row['eval_sum_keys_seconds']) * 1000:8.1f}ms "
+                              f"fusion={row['decrypt_fusion_seconds'] * 1000:6.2f}ms "
+                              f"ct={row['ciphertext_bytes']}B {'ok' if row['correct'] else 'WRONG'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.csv:
+        fields = sorted({key for row in results for key in row})
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import collections
+import logging
+import threading
+import time
+
+from fhe_params import create_crypto_context, profiles
+from key_ceremony import run_key_ceremony
+
+
+log = logging.getLogger(__name__)
+
+
+GameCrypto = collections.namedtuple('GameCrypto', ['crypto_context', 'key_pairs', 'public_key', 'timings'])
+
+
+def create_game_crypto(profile=profiles['default'], num_players=2, executor=None):
+    """Build a fresh crypto context, the chained key pairs of a `num_players` game and their joint eval keys.
+
+    The joint EvalMult and EvalSum keys are inserted into the context; they are
+    what lets the server compute the encrypted proximity of the players. Each
+    player's independent key round runs on `executor` when one is given;
+    `timings` holds the seconds of each ceremony step.
+    """
+    cc = create_crypto_context(profile)
+    ceremony = run_key_ceremony(cc, num_players, executor)
+    return GameCrypto(cc, ceremony.key_pairs, ceremony.public_key, ceremony.timings)
+
+
+class ContextPool:
+    """Keeps `target_size` ready-made GameCrypto bundles so a filling /join never runs keygen.
+
+    A daemon thread tops the pool up, waiting `refill_interval` seconds between
+    builds so refilling cannot starve request threads. When the pool is empty
+    `acquire()` falls back to building inline and counts a miss.
+    """
+
+    def __init__(self, build, target_size=4, refill_interval=0.0, latency_window=256):
+        self._build = build
+        self.target_size = target_size
+        self.refill_interval = refill_interval
+
+        self._ready = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_failures = 0
+        self._refill_latencies = collections.deque(maxlen=latency_window)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='context-pool', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._ready)
+
+    def acquire(self):
+        with self._cond:
+            if self._ready:
+                self.hits += 1
+                bundle = self._ready.popleft()
+                self._cond.notify_all()
+                return bundle
+            self.misses += 1
+            self._cond.notify_all()
+
+        return self._timed_build()
+
+    def metrics(self):
+        latencies = list(self._refill_latencies)
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._ready),
+            'target_size': self.target_size,
+            'refill_interval': self.refill_interval,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else None,
+            'builds': self.builds,
+            'build_failures': self.build_failures,
+            'refill_latency_avg': sum(latencies) / len(latencies) if latencies else None,
+            'refill_latency_max': max(latencies) if latencies else None,
+        }
+
+    def _timed_build(self):
+        started = time.perf_counter()
+        bundle = self._build()
+        self._refill_latencies.append(time.perf_counter() - started)
+        self.builds += 1
+        return bundle
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and len(self._ready) >= self.target_size:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+
+            try:
+                bundle = self._timed_build()
+            except Exception as e:
+                self.build_failures += 1
+                log.error("Context pool refill failed: %s", e)
+                time.sleep(max(self.refill_interval, 1.0))
+                continue
+
+            with self._cond:
+                self._ready.append(bundle)
+
+            if self.refill_interval:
+                time.sleep(self.refill_interval)
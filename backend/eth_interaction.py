@@ -1,44 +1,353 @@
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
+from web3._utils.abi import get_abi_output_types
 
-# 이더리움 네트워크와 상호작용하기 위한 Web3 인스턴스 생성
-w3 = Web3(Web3.HTTPProvider('https://your.ethereum.node'))
+# 이더리움 노드 주소. 테스트에서는 EthGateway(w3=Web3(Web3.EthereumTesterProvider()))처럼 로컬 노드를 넘깁니다.
+node_url = os.environ.get('ETH_NODE_URL', 'https://your.ethereum.node')
 
-def send_transaction(private_key, to_address, value):
+
+class TtlValue:
     """
-    주어진 개인 키로 이더리움 트랜잭션을 전송합니다.
-    
-    :param private_key: 트랜잭션을 서명할 개인 키
-    :param to_address: 이더를 보낼 주소
-    :param value: 전송할 이더의 양 (Wei 단위)
-    :return: 트랜잭션 해시
+    `ttl`초 동안 값을 캐시합니다. 가스 가격, 체인 ID처럼 자주 바뀌지 않는 조회에 사용합니다.
     """
-    account = w3.eth.account.from_key(private_key)
-    nonce = w3.eth.getTransactionCount(account.address)
 
-    transaction = {
-        'to': to_address,
-        'value': value,
-        'gas': 2000000,
-        'gasPrice': w3.toWei('50', 'gwei'),
-        'nonce': nonce,
-        'chainId': 1  # 메인넷
-    }
+    def __init__(self, fetch, ttl):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
 
-    signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-    txn_hash = w3.eth.sendRawTransaction(signed_txn.rawTransaction)
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires:
+                self._value = self._fetch()
+                self._expires = now + self.ttl
+            return self._value
 
-    return txn_hash.hex()
+    def invalidate(self):
+        with self._lock:
+            self._expires = 0.0
 
-def interact_with_contract(contract_address, abi, function_name, *args):
+
+class ReadCache:
+    """
+    view 함수 호출 결과의 LRU 캐시입니다. 키에 블록 번호가 들어가므로, 새 블록이 보이면 이전 블록의 결과를 모두 비웁니다.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.block_number = None
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def observe_block(self, block_number):
+        with self._lock:
+            if block_number != self.block_number:
+                self.block_number = block_number
+                self._results.clear()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return True, self._results[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            if key[0] != self.block_number:
+                return
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+
+def abi_hash(abi):
+    return hashlib.sha256(json.dumps(abi, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def freeze(value):
+    """함수 인수를 캐시 키로 쓸 수 있게 list/dict를 tuple로 바꿉니다."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    return value
+
+
+class NonceManager:
     """
-    스마트 계약과 상호작용합니다.
-    
-    :param contract_address: 스마트 계약 주소
-    :param abi: 스마트 계약의 ABI
-    :param function_name: 호출할 함수의 이름
-    :param args: 함수에 전달할 인수
-    :return: 함수 호출 결과
-    """
-    contract = w3.eth.contract(address=contract_address, abi=abi)
-    function = contract.functions[function_name](*args)
-    return function.call()  # 상태 변경이 없는 함수 호출
+    계정별 nonce를 로컬에서 관리합니다. 계정마다 처음 한 번만 노드에 묻고, 그 뒤로는 트랜잭션마다 1씩 올립니다.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._nonces = {}
+        self._lock = threading.Lock()
+
+    def next(self, address):
+        with self._lock:
+            if address not in self._nonces:
+                self._nonces[address] = self.w3.eth.getTransactionCount(address, 'pending')
+            nonce = self._nonces[address]
+            self._nonces[address] += 1
+            return nonce
+
+    def reset(self, address):
+        """전송이 실패해 로컬 nonce를 믿을 수 없을 때, 다음 트랜잭션에서 노드에 다시 묻게 합니다."""
+        with self._lock:
+            self._nonces.pop(address, None)
+
+
+class EthGateway:
+    """
+    이더리움 노드와의 모든 통신을 담당합니다.
+
+    HTTP 연결은 세션 풀에서 재사용하고, nonce는 NonceManager가, 가스 가격과 체인 ID는
+    `cache_ttl`초 캐시가 관리하므로 트랜잭션 한 건에 필요한 노드 호출은 sendRawTransaction 하나입니다.
+    `*_async` 메서드는 같은 작업을 풀 크기만큼의 스레드에서 실행하고 await할 수 있게 돌려줍니다.
+
+    :param provider_url: HTTP 노드 주소 (`w3`를 넘기지 않을 때 사용)
+    :param w3: 이미 만들어 둔 Web3 인스턴스 (예: eth-tester)
+    :param pool_size: HTTP 연결 풀과 스레드 풀 크기
+    :param cache_ttl: 가스 가격과 체인 ID를 캐시할 시간 (초)
+    :param block_ttl: 최신 블록 번호를 다시 묻기 전까지 믿는 시간 (초)
+    :param read_cache_size: view 함수 결과 캐시의 최대 항목 수
+
+    계약 객체는 (주소, ABI 해시)별로 한 번만 만들고, view 함수 결과는 (블록 번호, 계약, 함수, 인수)를 키로 캐시합니다.
+    `read_many`는 캐시에 없는 호출을 같은 블록 기준으로 하나의 JSON-RPC 배치 요청에 담아 보냅니다.
+    """
+
+    def __init__(self, provider_url=node_url, w3=None, pool_size=16, cache_ttl=30.0, gas=2000000, block_ttl=1.0,
+                 read_cache_size=4096):
+        self.session = None
+        self.provider_url = provider_url
+        if w3 is None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            w3 = Web3(Web3.HTTPProvider(provider_url, session=self.session))
+        self.w3 = w3
+        self.gas = gas
+        self.nonces = NonceManager(w3)
+        self.gas_price = TtlValue(lambda: self.w3.eth.gasPrice, cache_ttl)
+        self.chain_id = TtlValue(lambda: self.w3.eth.chainId, cache_ttl)
+        self.block_number = TtlValue(lambda: self.w3.eth.blockNumber, block_ttl)
+        self.reads = ReadCache(read_cache_size)
+        self._contracts = {}
+        self._contracts_lock = threading.Lock()
+        self._rpc_ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix='eth-gateway')
+
+    def send_transaction(self, private_key, to_address, value):
+        """
+        주어진 개인 키로 이더리움 트랜잭션을 전송합니다.
+
+        :param private_key: 트랜잭션을 서명할 개인 키
+        :param to_address: 이더를 보낼 주소
+        :param value: 전송할 이더의 양 (Wei 단위)
+        :return: 트랜잭션 해시
+        """
+        account = self.w3.eth.account.from_key(private_key)
+        transaction = {
+            'to': to_address,
+            'value': value,
+            'gas': self.gas,
+            'gasPrice': self.gas_price.get(),
+            'nonce': self.nonces.next(account.address),
+            'chainId': self.chain_id.get(),
+        }
+
+        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
+        try:
+            txn_hash = self.w3.eth.sendRawTransaction(signed_txn.rawTransaction)
+        except Exception:
+            self.nonces.reset(account.address)
+            raise
+        return txn_hash.hex()
+
+    def send_raw_transaction(self, raw_transaction):
+        """
+        클라이언트가 직접 서명한 트랜잭션을 그대로 노드에 전달합니다. 서버는 개인 키를 받지 않습니다.
+
+        :param raw_transaction: 서명된 트랜잭션 (bytes 또는 0x로 시작하는 hex 문자열)
+        :return: 트랜잭션 해시
+        """
+        return self.w3.eth.sendRawTransaction(raw_transaction).hex()
+
+    def transact_contract(self, private_key, contract_address, abi, function_name, *args):
+        """
+        상태를 바꾸는 스마트 계약 함수를 트랜잭션으로 호출합니다. 가스는 고정값 대신 estimateGas에 20% 여유를 두어 정합니다.
+
+        :param private_key: 트랜잭션을 서명할 개인 키
+        :param contract_address: 스마트 계약 주소
+        :param abi: 스마트 계약의 ABI
+        :param function_name: 호출할 함수의 이름
+        :param args: 함수에 전달할 인수
+        :return: 트랜잭션 해시
+        """
+        account = self.w3.eth.account.from_key(private_key)
+        contract, _ = self._contract_for(contract_address, abi)
+        function = contract.functions[function_name](*args)
+        gas = function.estimateGas({'from': account.address})
+        transaction = function.buildTransaction({
+            'from': account.address,
+            'gas': min(self.gas, gas * 6 // 5),
+            'gasPrice': self.gas_price.get(),
+            'nonce': self.nonces.next(account.address),
+            'chainId': self.chain_id.get(),
+        })
+
+        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
+        try:
+            txn_hash = self.w3.eth.sendRawTransaction(signed_txn.rawTransaction)
+        except Exception:
+            self.nonces.reset(account.address)
+            raise
+        return txn_hash.hex()
+
+    def wait_for_receipt(self, txn_hash, timeout=120):
+        """트랜잭션이 블록에 포함될 때까지 기다렸다가 영수증을 돌려줍니다."""
+        return self.w3.eth.waitForTransactionReceipt(txn_hash, timeout=timeout)
+
+    def _contract_for(self, contract_address, abi):
+        """(주소, ABI 해시)마다 한 번만 만든 계약 객체와 그 캐시 키를 돌려줍니다."""
+        key = (contract_address, abi_hash(abi))
+        with self._contracts_lock:
+            contract = self._contracts.get(key)
+            if contract is None:
+                contract = self._contracts[key] = self.w3.eth.contract(address=contract_address, abi=abi)
+            return contract, key
+
+    def interact_with_contract(self, contract_address, abi, function_name, *args):
+        """
+        스마트 계약과 상호작용합니다.
+
+        :param contract_address: 스마트 계약 주소
+        :param abi: 스마트 계약의 ABI
+        :param function_name: 호출할 함수의 이름
+        :param args: 함수에 전달할 인수
+        :return: 함수 호출 결과
+        """
+        return self.read_many([(contract_address, abi, function_name, args)])[0]
+
+    def read_many(self, calls):
+        """
+        서로 독립적인 view 함수 호출 여러 개를 같은 블록 기준으로 실행합니다.
+
+        :param calls: (계약 주소, ABI, 함수 이름, 인수 tuple)의 목록
+        :return: 호출 순서대로의 결과 목록
+        """
+        block_number = self.block_number.get()
+        self.reads.observe_block(block_number)
+
+        results = [None] * len(calls)
+        missing = []  # (index, cache key, contract function)
+        for i, (contract_address, abi, function_name, args) in enumerate(calls):
+            contract, contract_key = self._contract_for(contract_address, abi)
+            key = (block_number, contract_key, function_name, freeze(args))
+            found, value = self.reads.get(key)
+            if found:
+                results[i] = value
+            else:
+                missing.append((i, key, contract.functions[function_name](*args)))
+
+        if missing:
+            values = self._call_batch([function for _, _, function in missing], block_number)
+            for (i, key, _), value in zip(missing, values):
+                self.reads.put(key, value)
+                results[i] = value
+        return results
+
+    def _call_batch(self, functions, block_number):
+        if self.session is None or len(functions) == 1:
+            # 상태 변경이 없는 함수 호출; 로컬 테스트 노드처럼 HTTP가 아니면 하나씩 보냅니다.
+            return [function.call(block_identifier=block_number) for function in functions]
+
+        requests_by_id = {}
+        for function in functions:
+            request_id = next(self._rpc_ids)
+            requests_by_id[request_id] = {
+                'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_call',
+                'params': [{'to': function.address, 'data': function._encode_transaction_data()}, hex(block_number)],
+            }
+        response = self.session.post(self.provider_url, json=list(requests_by_id.values()))
+        response.raise_for_status()
+        replies = {reply['id']: reply for reply in response.json()}
+
+        values = []
+        for request_id, function in zip(requests_by_id, functions):
+            reply = replies[request_id]
+            if 'error' in reply:
+                raise RuntimeError(f"eth_call {function.fn_name} failed: {reply['error']}")
+            output_types = get_abi_output_types(function.abi)
+            decoded = self.w3.codec.decode_abi(output_types, bytes.fromhex(reply['result'][2:]))
+            values.append(decoded[0] if len(decoded) == 1 else list(decoded))
+        return values
+
+    def read_metrics(self):
+        return {
+            'block_number': self.reads.block_number,
+            'contracts': len(self._contracts),
+            'hits': self.reads.hits,
+            'misses': self.reads.misses,
+        }
+
+    async def send_transaction_async(self, private_key, to_address, value):
+        return await self._run(self.send_transaction, private_key, to_address, value)
+
+    async def send_raw_transaction_async(self, raw_transaction):
+        return await self._run(self.send_raw_transaction, raw_transaction)
+
+    async def interact_with_contract_async(self, contract_address, abi, function_name, *args):
+        return await self._run(self.interact_with_contract, contract_address, abi, function_name, *args)
+
+    async def read_many_async(self, calls):
+        return await self._run(self.read_many, calls)
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """서버 전체에서 공유하는 EthGateway를 처음 쓸 때 만듭니다."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = EthGateway()
+        return _gateway
+
+
+def send_transaction(private_key, to_address, value):
+    return get_gateway().send_transaction(private_key, to_address, value)
+
+
+def send_raw_transaction(raw_transaction):
+    return get_gateway().send_raw_transaction(raw_transaction)
+
+
+def interact_with_contract(contract_address, abi, function_name, *args):
+    return get_gateway().interact_with_contract(contract_address, abi, function_name, *args)
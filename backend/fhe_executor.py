@@ -0,0 +1,249 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import Future
+
+import fhe_worker
+
+log = logging.getLogger(__name__)
+
+class ExecutorBusy(Exception):
+    """Raised when the worker a job is routed to already has a full queue."""
+
+
+class JobFailed(Exception):
+    """Raised in the caller when a job raised inside its worker, or its worker died."""
+
+
+def _worker_main(tasks, results):
+    while True:
+        job = tasks.get()
+        if job is None:
+            return
+
+        job_id, op, args, submitted_at = job
+        started_at = time.time()
+        try:
+            value = fhe_worker.handlers[op](*args)
+            ok = True
+        except Exception:
+            value = traceback.format_exc()
+            ok = False
+        results.put((job_id, ok, value, started_at - submitted_at, time.time() - started_at, fhe_worker.take_timings()))
+
+
+class FheExecutor:
+    """Runs OpenFHE jobs on a pool of worker processes so request threads never do FHE work.
+
+    Jobs for a game always go to the same worker (by game id), which keeps that
+    game's deserialized context and runs its jobs in submission order. Jobs
+    without a game id go to the least loaded worker. Every worker has a bounded
+    queue; submitting to a full one raises ExecutorBusy instead of queueing
+    without limit. With `workers=0` jobs run inline on the calling thread.
+
+    Jobs submitted with `background=True` (key generation for the context
+    pool) run on `background_workers` separate processes when there are any,
+    so a long keygen never queues ahead of a live game's moves.
+
+    A worker that dies (crash, OOM kill) is noticed within `liveness_interval`
+    seconds: its pending jobs fail with JobFailed instead of leaving their
+    callers waiting, and later jobs for its games fail at once. Dead workers
+    are not replaced, since forking from the now threaded process is unsafe.
+
+    `observe(op, queue_seconds, run_seconds, timings, failed)` is called for
+    every finished job, with the (operation, seconds) timings its worker took.
+    """
+
+    def __init__(self, workers, queue_size=64, observe=None, liveness_interval=1.0, background_workers=0):
+        self.queue_size = queue_size
+        self.observe = observe
+        self.liveness_interval = liveness_interval
+        self._job_ids = itertools.count()
+        self._futures = {}
+        self._futures_lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+        # Workers are forked before any other thread is started, and never
+        # re-import the Flask app the way spawned processes would.
+        context = multiprocessing.get_context('fork')
+        self._results = context.Queue()
+        self._tasks = []
+        self._in_flight = []
+        self._processes = []
+        self._dead = set()  # indexes of workers that exited
+        self._game_workers = workers
+        for i in range(workers + background_workers if workers else 0):
+            tasks = context.Queue(maxsize=queue_size)
+            process = context.Process(target=_worker_main, args=(tasks, self._results), name=f'fhe-worker-{i}', daemon=True)
+            process.start()
+            self._tasks.append(tasks)
+            self._in_flight.append(0)
+            self._processes.append(process)
+
+        self._inline_lock = threading.Lock()
+        if workers:
+            threading.Thread(target=self._collect_results, name='fhe-results', daemon=True).start()
+
+    @property
+    def workers(self):
+        return self._game_workers
+
+    @property
+    def background_workers(self):
+        return len(self._processes) - self._game_workers if self._processes else 0
+
+    def worker_for(self, game_id):
+        return zlib.crc32(game_id.encode('utf-8')) % self._game_workers
+
+    def submit(self, op, *args, game_id=None, block=False, timeout=None, background=False):
+        """Queue a job and return a Future of its result.
+
+        `block=True` waits up to `timeout` for queue space instead of raising
+        ExecutorBusy; use it for follow-up jobs that must not be dropped.
+        """
+        if game_id is not None:
+            args = (game_id,) + args
+        if not self._tasks:
+            return self._run_inline(op, args)
+
+        if game_id is not None:
+            index = self.worker_for(game_id)
+        else:
+            candidates = range(self._game_workers)
+            if background and self.background_workers:
+                candidates = range(self._game_workers, len(self._tasks))
+            alive = [index for index in candidates if index not in self._dead]
+            index = min(alive, key=self._in_flight.__getitem__, default=0)
+        if index in self._dead:
+            raise JobFailed(f'FHE worker {index} has exited')
+
+        job_id = next(self._job_ids)
+        future = Future()
+        future.op = op
+        with self._futures_lock:
+            self._futures[job_id] = (future, index)
+            self._in_flight[index] += 1
+        try:
+            self._put(index, (job_id, op, args, time.time()), block, timeout)
+        except (queue.Full, JobFailed) as e:
+            with self._futures_lock:
+                if self._futures.pop(job_id, None) is not None:
+                    self._in_flight[index] -= 1
+            if isinstance(e, JobFailed):
+                raise
+            self._record(op, None, None, rejected=True)
+            raise ExecutorBusy(f'FHE worker {index} is busy ({self.queue_size} jobs queued)')
+        return future
+
+    def _put(self, index, job, block, timeout):
+        """Queue a job, giving up if the worker dies while a blocking put waits for space."""
+        if not block:
+            return self._tasks[index].put(job, block=False)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.liveness_interval if deadline is None else min(self.liveness_interval,
+                                                                      max(0.0, deadline - time.monotonic()))
+            try:
+                return self._tasks[index].put(job, timeout=wait)
+            except queue.Full:
+                if index in self._dead:
+                    raise JobFailed(f'FHE worker {index} has exited')
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def run(self, op, *args, game_id=None, block=False, timeout=None, background=False):
+        """Submit a job and wait for its result."""
+        return self.submit(op, *args, game_id=game_id, block=block, background=background).result(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            report = {}
+            for op, stats in self._stats.items():
+                done = stats['count']
+                report[op] = dict(stats, avg_queue_seconds=stats['queue_seconds'] / done if done else None,
+                                  avg_run_seconds=stats['run_seconds'] / done if done else None)
+        return {'workers': self.workers, 'background_workers': self.background_workers,
+                'queue_size': self.queue_size, 'dead_workers': sorted(self._dead),
+                'in_flight': list(self._in_flight), 'ops': report}
+
+    def shutdown(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join()
+
+    def _run_inline(self, op, args):
+        future = Future()
+        with self._inline_lock:
+            started_at = time.time()
+            try:
+                future.set_result(fhe_worker.handlers[op](*args))
+            except Exception as e:
+                future.set_exception(e)
+            self._record(op, 0.0, time.time() - started_at, timings=fhe_worker.take_timings(),
+                         failed=future.exception() is not None)
+        return future
+
+    def _collect_results(self):
+        next_check = time.monotonic() + self.liveness_interval
+        while True:
+            try:
+                job_id, ok, value, queue_seconds, run_seconds, timings = self._results.get(
+                    timeout=self.liveness_interval)
+            except queue.Empty:
+                job_id = None
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.liveness_interval
+            if job_id is None:
+                continue
+
+            with self._futures_lock:
+                entry = self._futures.pop(job_id, None)
+                if entry is None:
+                    continue  # already failed when its worker was found dead
+                future, index = entry
+                self._in_flight[index] -= 1
+
+            self._record(future.op, queue_seconds, run_seconds, timings=timings, failed=not ok)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(JobFailed(value))
+
+    def _check_workers(self):
+        """Fail the pending jobs of every worker that exited since the last check."""
+        for index, process in enumerate(self._processes):
+            if index in self._dead or process.is_alive():
+                continue
+            self._dead.add(index)
+            log.error('FHE worker %d exited with code %s; failing its jobs', index, process.exitcode)
+            with self._futures_lock:
+                lost = [(job_id, future) for job_id, (future, worker) in self._futures.items() if worker == index]
+                for job_id, _ in lost:
+                    del self._futures[job_id]
+                self._in_flight[index] = 0
+            for _, future in lost:
+                self._record(future.op, 0.0, 0.0, failed=True)
+                future.set_exception(JobFailed(f'FHE worker {index} exited with code {process.exitcode}'))
+
+    def _record(self, op, queue_seconds, run_seconds, rejected=False, failed=False, timings=()):
+        if self.observe is not None and not rejected:
+            self.observe(op, queue_seconds, run_seconds, timings, failed)
+        with self._stats_lock:
+            stats = self._stats.setdefault(op, {'count': 0, 'rejected': 0, 'failed': 0,
+                                                'queue_seconds': 0.0, 'run_seconds': 0.0, 'max_run_seconds': 0.0})
+            if rejected:
+                stats['rejected'] += 1
+                return
+            stats['count'] += 1
+            stats['failed'] += failed
+            stats['queue_seconds'] += queue_seconds
+            stats['run_seconds'] += run_seconds
+            stats['max_run_seconds'] = max(stats['max_run_seconds'], run_seconds)
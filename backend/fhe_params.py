@@ -0,0 +1,63 @@
+import collections
+import json
+
+from openfhe import *
+
+
+# Zero means "let OpenFHE choose" for ring_dimension and scaling_mod_size.
+FheProfile = collections.namedtuple('FheProfile', [
+    'name', 'plaintext_modulus', 'batch_size', 'multiplicative_depth', 'security_level',
+    'scaling_mod_size', 'ring_dimension',
+])
+
+security_levels = {
+    'none': HEStd_NotSet,
+    '128': HEStd_128_classic,
+    '192': HEStd_192_classic,
+    '256': HEStd_256_classic,
+}
+
+# The game circuit is one EvalSub, one EvalMult (depth 1) and an EvalSum over
+# the [x, y] slots, on values no larger than the board.
+profiles = {
+    'default': FheProfile('default', 65537, 16, 1, '128', 0, 0),
+    'wide': FheProfile('wide', 65537, 4096, 1, '128', 0, 0),
+}
+
+
+def get_profile(spec):
+    """Look a profile up by name, or build one from a JSON object of overrides on 'default'."""
+    if spec in profiles:
+        return profiles[spec]
+    try:
+        overrides = json.loads(spec)
+    except ValueError:
+        raise ValueError(f"Unknown FHE profile {spec!r}, expected one of {sorted(profiles)} or a JSON object")
+    return profiles['default']._replace(name='custom', **overrides)
+
+
+def required_plaintext_modulus(board_size, tile_size=1):
+    """Smallest plaintext modulus that holds every signed coordinate and squared distance of the board."""
+    span = (board_size - 1) * tile_size
+    return 2 * (2 * span * span) + 1
+
+
+def create_crypto_context(profile=profiles['default']):
+    parameters = CCParamsBGVRNS()
+    parameters.SetPlaintextModulus(profile.plaintext_modulus)
+    parameters.SetBatchSize(profile.batch_size)
+    parameters.SetMultiplicativeDepth(profile.multiplicative_depth)
+    parameters.SetSecurityLevel(security_levels[profile.security_level])
+    if profile.scaling_mod_size:
+        parameters.SetScalingModSize(profile.scaling_mod_size)
+    if profile.ring_dimension:
+        parameters.SetRingDim(profile.ring_dimension)
+    parameters.SetMultipartyMode(NOISE_FLOODING_MULTIPARTY)
+
+    cc = GenCryptoContext(parameters)
+    cc.Enable(PKE)
+    cc.Enable(KEYSWITCH)
+    cc.Enable(LEVELEDSHE)
+    cc.Enable(ADVANCEDSHE)
+    cc.Enable(MULTIPARTY)
+    return cc
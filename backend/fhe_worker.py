@@ -0,0 +1,191 @@
+"""Job handlers that run inside the FHE worker processes.
+
+Each worker keeps the deserialized crypto context (with its joint eval keys)
+and the move accumulator of every game pinned to it in `games`, so a job only carries the game id and
+the new ciphertext bytes. Everything crossing the process boundary is
+serialized bytes; OpenFHE objects never leave the worker.
+
+Handlers time their OpenFHE operations with `timed`; the executor sends the
+timings of a job back with its result (see `take_timings`).
+"""
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openfhe import *
+
+from context_pool import create_game_crypto
+from move_accumulator import MoveAccumulator
+from serialization import deserialize_ciphertext, load_eval_keys, ser_type_from_name, serialize, serialize_eval_keys
+
+
+games = {}
+
+# Runs the independent per-player rounds of a key ceremony; created lazily so it starts after the fork.
+ceremony_threads = int(os.environ.get('KEY_CEREMONY_THREADS', 4))
+_ceremony_executor = None
+
+_timings = []  # (op, seconds) of the current job
+
+
+class WorkerGame:
+    def __init__(self, crypto_context, profile, num_players):
+        self.crypto_context = crypto_context
+        self.profile = profile
+        self.moves = MoveAccumulator(crypto_context, num_players)
+        self.moved = {}  # (stage, player_index) -> deserialize seconds of the moves taken since the last fold
+        self.shares = {}  # stage -> {player_index: [partial decryption per input ciphertext]}
+
+
+@contextlib.contextmanager
+def timed(op):
+    started = time.perf_counter()
+    yield
+    _timings.append((op, time.perf_counter() - started))
+
+
+def take_timings():
+    """Return and clear the operation timings recorded since the last call."""
+    timings = _timings[:]
+    _timings.clear()
+    return timings
+
+
+def ceremony_executor():
+    global _ceremony_executor
+    if _ceremony_executor is None and ceremony_threads > 1:
+        _ceremony_executor = ThreadPoolExecutor(ceremony_threads, thread_name_prefix='key-ceremony')
+    return _ceremony_executor
+
+
+def build_game(ser_name, profile, num_players=2):
+    """Run context and key generation of a `num_players` game for `profile` and return the results serialized."""
+    ser_type = ser_type_from_name(ser_name)
+    crypto = create_game_crypto(profile, num_players, ceremony_executor())
+    _timings.extend(crypto.timings.items())
+    return {
+        'crypto_context': serialize(crypto.crypto_context, ser_type),
+        'public_key': serialize(crypto.public_key, ser_type),
+        'secret_keys': [serialize(kp.secretKey, ser_type) for kp in crypto.key_pairs],
+        'eval_keys': serialize_eval_keys(crypto.crypto_context, ser_type, crypto.public_key.GetKeyTag()),
+        'ser_type': ser_name,
+        'profile': profile,
+    }
+
+
+def load_game(game_id, crypto_context, eval_keys, ser_name, profile, num_players):
+    ser_type = ser_type_from_name(ser_name)
+    with timed('load_context'):
+        cc = DeserializeCryptoContextString(crypto_context, ser_type)
+        if not cc:
+            raise RuntimeError(f'Failed to deserialize the crypto context of game {game_id}')
+        load_eval_keys(cc, eval_keys, ser_type)
+    games[game_id] = WorkerGame(cc, profile, num_players)
+    return True
+
+
+def push_move(game_id, stage, player_index, payload, ser_name):
+    """Deserialize a move ciphertext and queue it.
+
+    Returns the deserialize time in seconds, or None if the payload is not a
+    valid ciphertext. A player moves once per stage: when a caller timed out
+    and sends the same turn again, the first move stands and its time is
+    returned, so a retry never adds a second move.
+    """
+    game = games[game_id]
+    if (stage, player_index) in game.moved:
+        return game.moved[stage, player_index]
+
+    started = time.perf_counter()
+    try:
+        ciphertext = deserialize_ciphertext(payload, ser_type_from_name(ser_name))
+    except Exception:
+        return None
+    elapsed = time.perf_counter() - started
+    _timings.append(('deserialize', elapsed))
+    if not ciphertext:
+        return None
+    game.moves.push(player_index, ciphertext)
+    game.moved[stage, player_index] = elapsed
+    return elapsed
+
+
+def encrypted_proximity(cc, hider, seeker, batch_size):
+    """Encrypt (hx - sx)^2 + (hy - sy)^2 into slot 0 without decrypting either position.
+
+    On the integer board a squared distance of at most 1 is exactly the
+    Manhattan distance of at most 1 that ends the game, so this one slot is
+    all the players have to decrypt.
+    """
+    difference = cc.EvalSub(hider, seeker)
+    squared = cc.EvalMult(difference, difference)
+    return cc.EvalSum(squared, batch_size)
+
+
+def fold_moves(game_id, ser_name, hider_index, seeker_indices):
+    """Fold the stage's moves and return one serialized proximity ciphertext per seeker as the decryption inputs."""
+    game = games[game_id]
+    ser_type = ser_type_from_name(ser_name)
+    with timed('eval_add'):
+        positions = game.moves.fold()
+    game.moved.clear()
+    game.shares.clear()  # every earlier stage is decrypted before the next one is folded
+    inputs = []
+    for seeker_index in seeker_indices:
+        with timed('proximity'):
+            proximity = encrypted_proximity(game.crypto_context, positions[hider_index], positions[seeker_index],
+                                            game.profile.batch_size)
+        with timed('serialize'):
+            inputs.append(serialize(proximity, ser_type))
+    return inputs
+
+
+def push_share(game_id, stage, player_index, payloads, ser_name):
+    """Deserialize one player's partial decryptions as soon as they arrive.
+
+    Returns False if any of them is not a valid ciphertext.
+    """
+    ser_type = ser_type_from_name(ser_name)
+    try:
+        with timed('deserialize'):
+            shares = [deserialize_ciphertext(payload, ser_type) for payload in payloads]
+    except Exception:
+        return False
+    if not all(shares):
+        return False
+    games[game_id].shares.setdefault(stage, {})[player_index] = shares
+    return True
+
+
+def fuse_shares(game_id, stage, length):
+    """Combine every player's shares of the stage and return the decoded slot values per input.
+
+    The shares stay until the next fold, so a fusion that failed or timed out can be run again.
+    """
+    game = games[game_id]
+    shares = game.shares[stage]
+    players = sorted(shares)
+
+    values = []
+    for i in range(len(shares[players[0]])):
+        with timed('fusion'):
+            plaintext = game.crypto_context.MultipartyDecryptFusion([shares[p][i] for p in players])
+        plaintext.SetLength(length)
+        values.append(list(plaintext.GetPackedValue()))
+    return values
+
+
+def drop_game(game_id):
+    return games.pop(game_id, None) is not None
+
+
+handlers = {
+    'build_game': build_game,
+    'load_game': load_game,
+    'push_move': push_move,
+    'fold_moves': fold_moves,
+    'push_share': push_share,
+    'fuse_shares': fuse_shares,
+    'drop_game': drop_game,
+}
@@ -0,0 +1,223 @@
+import collections
+import hmac
+import secrets
+import threading
+import time
+import uuid
+
+
+class GameError(Exception):
+    """Error raised by room operations, carrying the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class GameRoom:
+    """State of a single match: its crypto material, players and turn counter."""
+
+    def __init__(self, game_id, max_players, max_stage):
+        self.game_id = game_id
+        self.max_players = max_players
+        self.max_stage = max_stage
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)  # notified on every event, see notify()
+
+        self.players = []
+        self.player_tokens = []  # secret handed to each player by /join, see owns()
+        self.current_stage = 1
+        self.current_turn = 1
+        self.is_decryption_stage = False
+        self.decryption_rounds = {}  # ended stage -> DecryptionRound
+        self.crypto = None  # serialized context and keys; the live objects stay in the FHE worker
+        self.payloads = {}  # name -> CachedPayload of serialized crypto objects
+        self.finished = False
+        self.winner = None
+
+        self.version = 0  # bumped by every event, used as the SSE event id
+        self.last_event = None
+        self.turn_started = None  # monotonic time the current turn was announced
+
+    def is_full(self):
+        return len(self.players) >= self.max_players
+
+    def add_player(self, address):
+        if self.finished:
+            raise GameError('Game is already finished', 410)
+        if self.is_full():
+            raise GameError('Game is already full', 399)
+
+        self.players.append(address)
+        self.player_tokens.append(secrets.token_urlsafe(32))
+        return len(self.players)
+
+    def owns(self, player_id, token):
+        """Whether `token` is the secret /join gave to `player_id`."""
+        if not token or not 0 < player_id <= len(self.player_tokens):
+            return False
+        return hmac.compare_digest(self.player_tokens[player_id - 1], token)
+
+    def advance_turn(self):
+        """Pass the turn on; after the last player the stage ends and decryption starts.
+
+        Returns True when this call ended the stage.
+        """
+        stage_ended = False
+        self.current_turn = (self.current_turn + 1) % (self.max_players + 1)
+        if self.current_turn == 0:
+            self.is_decryption_stage = True
+            stage_ended = True
+
+            self.current_stage += 1
+            self.current_turn = 1
+
+        if self.current_stage == self.max_stage:
+            self.finished = True
+            self.winner = 'hider'
+        return stage_ended
+
+    def state_for(self, player_id=None):
+        """The public part of the room, safe to send to any player."""
+        return {
+            'game_id': self.game_id,
+            'players': len(self.players),
+            'started': self.crypto is not None,
+            'current_stage': self.current_stage,
+            'current_turn': self.current_turn,
+            'is_decryption_stage': self.is_decryption_stage,
+            'finished': self.finished,
+            'winner': self.winner,
+            'version': self.version,
+        }
+
+    def notify(self, event):
+        """Record a state change and wake every subscriber; the caller may already hold `lock`."""
+        with self.changed:
+            self.version += 1
+            self.last_event = event
+            self.turn_started = time.monotonic()
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the room moves past `version` or `timeout` passes.
+
+        Returns (version, event, state); the event is None on a timeout.
+        """
+        with self.changed:
+            if not self.changed.wait_for(lambda: self.version > version, timeout):
+                return self.version, None, self.state_for()
+            return self.version, self.last_event, self.state_for()
+
+
+class DecryptionRound:
+    """Threshold decryption of the positions folded at the end of one stage.
+
+    `inputs` is the future of the fold job, resolving to the serialized
+    ciphertexts every player has to partially decrypt. Shares are pushed to the
+    FHE worker as they arrive; the request carrying the last one runs the
+    fusion and publishes the result to everyone waiting on `done`.
+    """
+
+    def __init__(self, stage, num_players, inputs):
+        self.stage = stage
+        self.num_players = num_players
+        self.inputs = inputs
+        self.input_payloads = {}  # index -> CachedPayload, built on first download
+        self.submitted = set()
+        self.result = None
+        self.done = threading.Event()
+
+    def add_share(self, player_id):
+        """Record a player's share; returns True when it was the last one."""
+        self.submitted.add(player_id)
+        return len(self.submitted) == self.num_players
+
+    def withdraw_share(self, player_id):
+        """Forget the last share after its fusion failed, so that player can send it again."""
+        self.submitted.discard(player_id)
+
+    def publish(self, result):
+        self.result = result
+        self.inputs = None
+        self.input_payloads = {}
+        self.done.set()
+
+    def public_result(self):
+        """The fused result every player sees: only the squared distance and whether it was a catch."""
+        return dict(self.result, stage=self.stage)
+
+
+class RoomRegistry:
+    """Rooms keyed by game id.
+
+    The registry lock only guards the dicts; everything that happens inside a
+    match is serialized by that room's own lock, so matches never wait on each
+    other. Finished rooms stay readable for `retention` seconds (see retire()).
+    """
+
+    def __init__(self, max_players, max_stage, retention=120):
+        self.max_players = max_players
+        self.max_stage = max_stage
+        self.retention = retention
+        self._rooms = {}
+        self._open_rooms = {}  # rooms still waiting for players, in creation order
+        self._retired = collections.deque()  # (expiry, game_id) of finished rooms, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def open_count(self):
+        return len(self._open_rooms)
+
+    def retired_count(self):
+        return len(self._retired)
+
+    def get(self, game_id):
+        room = self._rooms.get(game_id)
+        if room is None:
+            raise GameError(f'Unknown game {game_id}', 404)
+        return room
+
+    def create(self):
+        room = GameRoom(uuid.uuid4().hex, self.max_players, self.max_stage)
+        with self._lock:
+            self._sweep()
+            self._rooms[room.game_id] = room
+            self._open_rooms[room.game_id] = room
+        return room
+
+    def find_open(self):
+        """Return the oldest room that still has a free seat, creating one if none does."""
+        with self._lock:
+            for room in self._open_rooms.values():
+                return room
+        return self.create()
+
+    def mark_full(self, room):
+        with self._lock:
+            self._open_rooms.pop(room.game_id, None)
+
+    def retire(self, room):
+        """Keep a finished room for `retention` seconds before evicting it.
+
+        Players still long-polling the last decryption or reading the final
+        state get the answer instead of a 404; nobody can join it any more.
+        """
+        with self._lock:
+            self._open_rooms.pop(room.game_id, None)
+            self._retired.append((time.monotonic() + self.retention, room.game_id))
+            self._sweep()
+
+    def evict(self, room):
+        with self._lock:
+            self._rooms.pop(room.game_id, None)
+            self._open_rooms.pop(room.game_id, None)
+
+    def _sweep(self):
+        now = time.monotonic()
+        while self._retired and self._retired[0][0] <= now:
+            _, game_id = self._retired.popleft()
+            self._rooms.pop(game_id, None)
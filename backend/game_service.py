@@ -0,0 +1,356 @@
+"""Game logic shared by the Flask app (app.py) and the ASGI app (asgi_app.py).
+
+The two apps only differ in how they read requests, hold a room's lock and wait
+for FHE jobs: app.py blocks its request thread, asgi_app.py awaits on the event
+loop. The checks, turns and stages, decryption rounds, finishing a game and the
+stats are all here, so both apps answer the same. Errors are raised as
+GameError carrying the HTTP status to answer with.
+
+Importing this module starts the FHE workers, the context pool and, when
+configured, the settlement queue.
+"""
+import collections
+import json
+import logging
+import os
+import time
+
+from context_pool import ContextPool
+from eth_interaction import get_gateway
+from fhe_executor import FheExecutor
+from fhe_params import get_profile
+from game_room import DecryptionRound, GameError, RoomRegistry
+import metrics
+from payload_cache import CachedPayload
+from serialization import content_type_for, ser_type_from_name, ser_type_name, ser_types
+from settlement import SettlementQueue
+
+
+metrics.configure_logging()
+log = logging.getLogger('game_service')
+
+max_players = int(os.environ.get('MAX_PLAYERS', 2))  # one hider, the rest seek
+max_stage = 10
+serType = ser_type_from_name(os.environ.get('FHE_SERIALIZATION', 'binary'))
+fhe_profile = get_profile(os.environ.get('FHE_PROFILE', 'default'))
+
+hider_player = 1
+seeker_players = range(2, max_players + 1)
+found_distance = 1  # the seeker wins once the Manhattan distance is at most this
+decryption_wait_limit = 30  # longest long-poll on /decryption_result, in seconds
+
+event_keepalive = 15  # seconds between SSE comments on an idle /events stream
+
+# Seconds from announcing a turn (pushed over /events) to that player's move arriving.
+turn_latencies = collections.deque(maxlen=1024)
+
+# Per wire format: number of ciphertexts received, their total size and deserialize time.
+deserialization_stats = {name: {'count': 0, 'bytes': 0, 'seconds': 0.0} for name in ser_types}
+
+context_pool_size = int(os.environ.get('CONTEXT_POOL_SIZE', 4))
+context_pool_refill_interval = float(os.environ.get('CONTEXT_POOL_REFILL_INTERVAL', 0))
+
+fhe_workers = int(os.environ.get('FHE_WORKERS', os.cpu_count() or 1))
+fhe_queue_size = int(os.environ.get('FHE_QUEUE_SIZE', 64))
+fhe_job_timeout = float(os.environ.get('FHE_JOB_TIMEOUT', 30))
+fhe_keygen_workers = int(os.environ.get('FHE_KEYGEN_WORKERS', 1))  # the context pool's keygen runs on these
+
+# Seconds a finished room keeps answering state and decryption requests; longer than any long-poll.
+finished_room_retention = float(os.environ.get('FINISHED_ROOM_RETENTION', 120))
+
+# The executor forks its workers, so it has to exist before any thread is started.
+fhe = FheExecutor(fhe_workers, fhe_queue_size, observe=metrics.observe_fhe_job,
+                  background_workers=fhe_keygen_workers)
+
+rooms = RoomRegistry(max_players, max_stage, finished_room_retention)
+metrics.watch(rooms, fhe)
+context_pool = ContextPool(build=lambda: fhe.run('build_game', ser_type_name(serType), fhe_profile, max_players,
+                                                     block=True, background=True),
+                           target_size=context_pool_size, refill_interval=context_pool_refill_interval).start()
+
+# Finished games are settled on chain in batches when a settlement contract is configured.
+settlement = None
+if os.environ.get('SETTLEMENT_CONTRACT'):
+    settlement = SettlementQueue(get_gateway(), os.environ['SETTLEMENT_PRIVATE_KEY'], os.environ['SETTLEMENT_CONTRACT'],
+                                 max_batch=int(os.environ.get('SETTLEMENT_BATCH', 32)),
+                                 max_wait=float(os.environ.get('SETTLEMENT_MAX_WAIT', 5))).start()
+
+
+def require(message, *values):
+    """Reject a request that is missing any of `values`."""
+    if not all(values):
+        raise GameError(message, 400)
+
+
+def room_for_join(game_id):
+    return rooms.get(game_id) if game_id else rooms.find_open()
+
+
+def seat(room, address, game_id):
+    """Add a player to `room`; the caller holds the room's lock.
+
+    Returns the new player id, or None when the room filled up between lookup
+    and lock and the caller should look for another one. Once the room is full
+    the caller starts the game.
+    """
+    if not game_id and (room.is_full() or room.finished):
+        return None
+
+    player_id = room.add_player(address)
+    if room.is_full():
+        rooms.mark_full(room)
+    else:
+        room.notify('player_joined')
+    return player_id
+
+
+def load_game_args(room, crypto):
+    """Arguments of the worker's load_game job for a context taken from the pool."""
+    return crypto['crypto_context'], crypto['eval_keys'], crypto['ser_type'], crypto['profile'], room.max_players
+
+
+def game_failed(room, error):
+    """Close a room whose game could not be started; returns the error to raise.
+
+    The room is already full, so it would never open again: it is evicted and
+    ended, which also ends the /events streams of the players already in it.
+    The caller holds the room's lock.
+    """
+    log.warning('Game %s could not start: %s', room.game_id, error)
+    rooms.evict(room)
+    room.finished = True
+    room.notify('failed')
+    return GameError(f'Key generation failed: {error}', 399)
+
+
+def start_game(room, crypto):
+    room.crypto = crypto
+
+    # Both objects are fixed for the whole game and arrive already serialized.
+    content_type = content_type_for(serType)
+    room.payloads['crypto_context'] = CachedPayload(crypto['crypto_context'], content_type)
+    room.payloads['public_key'] = CachedPayload(crypto['public_key'], content_type)
+    log.info('Game %s started with %d players', room.game_id, len(room.players))
+    room.notify('game_started')
+
+
+def join_response(room, player_id):
+    """The only response carrying the player's token; the client sends it back to fetch its key share."""
+    return {'message': f'Player {player_id} joined', 'player_id': player_id, 'game_id': room.game_id,
+            'player_token': room.player_tokens[player_id - 1]}
+
+
+def finish_game(room):
+    """Retire a finished room; the caller drops the game from its FHE worker."""
+    log.info('Game %s finished, winner %s', room.game_id, room.winner)
+    rooms.retire(room)
+    if settlement is not None:
+        settlement.submit(room.game_id, room.winner)
+
+
+def record_deserialization(ser_type, size, seconds):
+    stats = deserialization_stats[ser_type_name(ser_type)]
+    stats['count'] += 1
+    stats['bytes'] += size
+    stats['seconds'] += seconds
+    metrics.ciphertext_bytes.labels('received', 'move').inc(size)
+
+
+def check_move(room, player_id):
+    if room.finished:
+        raise GameError('Game is already finished', 410)
+    if room.crypto is None:
+        raise GameError('Game has not started yet', 400)
+    if room.is_decryption_stage:
+        raise GameError('Decryption stage in progress', 409)
+    if room.current_turn != player_id:
+        raise GameError('Not your turn', 400)
+
+
+def push_move_args(room, player_id, payload, ser_type):
+    """The stage and player make the job idempotent: a retry after a timeout is not applied twice."""
+    return room.current_stage, player_id - 1, payload, ser_type_name(ser_type)
+
+
+def record_move(room, player_id, payload, ser_type, deserialize_seconds):
+    """Account for a move the worker took and pass the turn on.
+
+    Returns True when the move ended the stage; the caller then submits
+    fold_moves (with `fold_args()`) and hands its future to start_decryption.
+    """
+    if deserialize_seconds is None:
+        raise GameError('Failed to deserialize ciphertext', 400)
+    record_deserialization(ser_type, len(payload), deserialize_seconds)
+    turn_latencies.append(time.monotonic() - room.turn_started)
+    metrics.turn_seconds.observe(turn_latencies[-1])
+
+    if room.advance_turn():
+        return True
+    room.notify('turn')
+    return False
+
+
+def fold_args():
+    return ser_type_name(serType), hider_player - 1, [seeker - 1 for seeker in seeker_players]
+
+
+def start_decryption(room, inputs):
+    stage = room.current_stage - 1
+    room.decryption_rounds[stage] = DecryptionRound(stage, room.max_players, inputs)
+    room.notify('finished' if room.finished else 'decryption_started')
+
+
+def move_response(room, player_id):
+    if room.finished:
+        return {'message': 'Hiders won!'}
+    return {'message': f'Player {player_id} moved'}
+
+
+def crypto_payload(room, name):
+    """A room's serialized crypto context or public key."""
+    payload = room.payloads.get(name)
+    if payload is None:
+        raise GameError(f"{name.replace('_', ' ').capitalize()} not generated yet", 400)
+    return payload
+
+
+def record_sent(body, kind):
+    metrics.ciphertext_bytes.labels('sent', kind).inc(len(body))
+    return body
+
+
+def event_message(version, event, state):
+    """One SSE event; it carries the full public state, so the latest one is all a client needs."""
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(state)}\n\n"
+
+
+keepalive_message = ": keep-alive\n\n"
+
+
+def key_share(room, player_id, token):
+    if room.crypto is None:
+        raise GameError('Keys not generated yet', 400)
+    if not room.owns(player_id, token):
+        raise GameError('Not your key share', 403)
+
+    return record_sent(room.crypto['secret_keys'][player_id - 1], 'key_share')
+
+
+def get_decryption_round(room, stage):
+    decryption_round = room.decryption_rounds.get(stage)
+    if decryption_round is None:
+        raise GameError(f'No decryption round for stage {stage}', 404)
+    return decryption_round
+
+
+def open_decryption_round(room, stage):
+    """The fold job and payload cache of the round a player downloads inputs of; the caller holds the room's lock.
+
+    They are copied out under the lock, since publishing the round drops them.
+    """
+    decryption_round = get_decryption_round(room, stage)
+    if decryption_round.result is not None:
+        raise GameError(f'Stage {stage} is already decrypted', 410)
+    return decryption_round.inputs, decryption_round.input_payloads
+
+
+def decryption_input(input_payloads, index, inputs):
+    """The cached payload of one decryption input, given the resolved fold job."""
+    payload = input_payloads.get(index)
+    if payload is None:
+        if not 0 <= index < len(inputs) or inputs[index] is None:
+            raise GameError(f'No decryption input {index}', 404)
+        payload = input_payloads.setdefault(index, CachedPayload(inputs[index], content_type_for(serType)))
+    return payload
+
+
+def record_shares(shares):
+    metrics.ciphertext_bytes.labels('received', 'partial_decryption').inc(sum(len(share) for share in shares))
+
+
+def check_share(room, stage, player_id):
+    """The round a player's share is for; the caller holds the room's lock."""
+    decryption_round = get_decryption_round(room, stage)
+    if decryption_round.result is not None:
+        raise GameError(f'Stage {stage} is already decrypted', 409)
+    if not 0 < player_id <= room.max_players:
+        raise GameError('Invalid player_id', 400)
+    if player_id in decryption_round.submitted:
+        raise GameError(f'Player {player_id} already sent a share for stage {stage}', 409)
+    return decryption_round
+
+
+def push_share_args(stage, player_id, shares, ser_type):
+    return stage, player_id - 1, shares, ser_type_name(ser_type)
+
+
+def add_share(decryption_round, player_id, accepted):
+    """Record a share the worker took; returns True when it was the last one and the shares can be fused."""
+    if not accepted:
+        raise GameError('Failed to deserialize partial decryption', 400)
+    return decryption_round.add_share(player_id)
+
+
+def share_response(decryption_round, player_id):
+    waiting_for = decryption_round.num_players - len(decryption_round.submitted)
+    return {'message': f'Share of player {player_id} received', 'waiting_for': waiting_for}
+
+
+def publish_decryption(room, decryption_round, values):
+    # One decryption input per seeker: its encrypted squared distance to the hider.
+    distance_squared = min(value[0] for value in values)
+    found = distance_squared <= found_distance ** 2
+
+    room.is_decryption_stage = False
+    if found:
+        room.finished = True
+        room.winner = 'seeker'
+    decryption_round.publish({'distance_squared': distance_squared, 'found': found})
+    room.notify('finished' if room.finished else 'decryption_finished')
+
+
+def decryption_response(room, decryption_round):
+    return dict(decryption_round.public_result(), finished=room.finished, winner=room.winner)
+
+
+def pending_response(decryption_round):
+    """Body of the 202 a long-poll answers with while shares are missing."""
+    waiting_for = decryption_round.num_players - len(decryption_round.submitted)
+    return {'message': 'Waiting for partial decryptions', 'waiting_for': waiting_for}
+
+
+def turn_report():
+    latencies = sorted(turn_latencies)
+    return {
+        'count': len(latencies),
+        'avg_seconds': sum(latencies) / len(latencies) if latencies else None,
+        'p50_seconds': latencies[len(latencies) // 2] if latencies else None,
+        'p95_seconds': latencies[int(len(latencies) * 0.95)] if latencies else None,
+        'max_seconds': latencies[-1] if latencies else None,
+    }
+
+
+def settlement_report():
+    return settlement.metrics() if settlement is not None else {'enabled': False}
+
+
+def serialization_report():
+    report = {}
+    for name, stats in deserialization_stats.items():
+        count = stats['count']
+        report[name] = dict(stats, avg_bytes=stats['bytes'] / count if count else None,
+                            avg_deserialize_seconds=stats['seconds'] / count if count else None)
+    return report
+
+
+def read_transaction(body):
+    """The signed raw transaction of a /send_transaction body; private keys are never taken over HTTP."""
+    transaction_data = (body or {}).get('transaction')
+    if not transaction_data:
+        raise GameError('No transaction data provided', 400)
+    if 'private_key' in transaction_data:
+        raise GameError('Sign the transaction yourself and send it as raw_transaction; private keys are not accepted', 400)
+    raw_transaction = transaction_data.get('raw_transaction')
+    if not isinstance(raw_transaction, str) or not raw_transaction.startswith('0x'):
+        raise GameError('Transaction is missing raw_transaction (hex, 0x-prefixed)', 400)
+    return raw_transaction
@@ -0,0 +1,88 @@
+"""Key ceremony for games of N players.
+
+Chains the public key through every party (KeyGen, then MultipartyKeyGen per
+party) and runs the joint eval key rounds for N parties: EvalMult keys via
+MultiKeySwitchGen / MultiAddEvalKeys / MultiMultEvalKey / MultiAddEvalMultKeys
+and EvalSum keys via MultiEvalSumKeyGen / MultiAddEvalSumKeys.
+
+The public key chain and the MultiAdd* combinations are sequential by nature,
+but each party's own contribution (its MultiKeySwitchGen, MultiEvalSumKeyGen
+and MultiMultEvalKey) only depends on already finished rounds, so those run
+on `executor` side by side.
+"""
+import collections
+import time
+
+
+KeyCeremony = collections.namedtuple('KeyCeremony', ['key_pairs', 'public_key', 'timings'])
+
+
+class _Timings(dict):
+    def add(self, phase, started):
+        self[phase] = self.get(phase, 0.0) + time.perf_counter() - started
+
+
+def _map(executor, fn, *iterables):
+    if executor is None:
+        return list(map(fn, *iterables))
+    return list(executor.map(fn, *iterables))
+
+
+def run_key_ceremony(cc, parties, executor=None, eval_keys=True):
+    """Generate the chained key pairs of `parties` players and insert their joint eval keys into `cc`.
+
+    Returns a KeyCeremony whose `timings` holds the seconds spent in the
+    'keygen', 'eval_mult_keys' and 'eval_sum_keys' rounds.
+    """
+    if parties < 2:
+        raise ValueError('A threshold game needs at least 2 parties')
+    timings = _Timings()
+
+    started = time.perf_counter()
+    key_pairs = [cc.KeyGen()]
+    for _ in range(1, parties):
+        key_pairs.append(cc.MultipartyKeyGen(key_pairs[-1].publicKey))
+    timings.add('keygen', started)
+    if not all(kp.good() for kp in key_pairs):
+        raise RuntimeError('Key generation failed')
+
+    if eval_keys:
+        _run_eval_mult_rounds(cc, key_pairs, executor, timings)
+        _run_eval_sum_rounds(cc, key_pairs, executor, timings)
+
+    return KeyCeremony(key_pairs, key_pairs[-1].publicKey, dict(timings))
+
+
+def _run_eval_mult_rounds(cc, key_pairs, executor, timings):
+    started = time.perf_counter()
+    first, others = key_pairs[0], key_pairs[1:]
+    keyTag = key_pairs[-1].publicKey.GetKeyTag()
+
+    evalMultKey = cc.KeySwitchGen(first.secretKey, first.secretKey)
+    shares = _map(executor, lambda kp: cc.MultiKeySwitchGen(kp.secretKey, kp.secretKey, evalMultKey), others)
+
+    evalMultJoint = evalMultKey
+    for kp, share in zip(others, shares):
+        evalMultJoint = cc.MultiAddEvalKeys(evalMultJoint, share, kp.publicKey.GetKeyTag())
+
+    parts = _map(executor, lambda kp: cc.MultiMultEvalKey(kp.secretKey, evalMultJoint, keyTag), key_pairs)
+    evalMultFinal = parts[0]
+    for part in parts[1:]:
+        evalMultFinal = cc.MultiAddEvalMultKeys(evalMultFinal, part, evalMultFinal.GetKeyTag())
+    cc.InsertEvalMultKey([evalMultFinal])
+    timings.add('eval_mult_keys', started)
+
+
+def _run_eval_sum_rounds(cc, key_pairs, executor, timings):
+    started = time.perf_counter()
+    first, others = key_pairs[0], key_pairs[1:]
+
+    cc.EvalSumKeyGen(first.secretKey)
+    evalSumKeys = cc.GetEvalSumKeyMap(first.secretKey.GetKeyTag())
+    shares = _map(executor, lambda kp: cc.MultiEvalSumKeyGen(kp.secretKey, evalSumKeys, kp.publicKey.GetKeyTag()), others)
+
+    evalSumJoint = evalSumKeys
+    for kp, share in zip(others, shares):
+        evalSumJoint = cc.MultiAddEvalSumKeys(evalSumJoint, share, kp.publicKey.GetKeyTag())
+    cc.InsertEvalSumKey(evalSumJoint)
+    timings.add('eval_sum_keys', started)
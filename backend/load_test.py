@@ -0,0 +1,168 @@
+"""Load test comparing the Flask app (app.py) with the ASGI app (asgi_app.py).
+
+Every simulated player joins, downloads the context and keys, then plays:
+it polls its room state, sends an encrypted move on its turn and takes part in
+each stage's threshold decryption. Client-side OpenFHE work runs on threads
+and is not counted in request latency. Requests/sec and p50/p99 latency per
+route are reported for every target and client count. simulate.py starts the
+servers itself and adds server CPU and memory.
+
+Start both servers first, e.g. `python app.py` and
+`uvicorn asgi_app:app --port 8000`, then:
+
+    python load_test.py --target flask=http://127.0.0.1:5000 --target asgi=http://127.0.0.1:8000 \\
+        --clients 100 1000 --duration 60 --json load.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+import uuid
+
+import aiohttp
+from openfhe import *
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+
+    async def request(self, session, method, route, url, **kwargs):
+        started = time.perf_counter()
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+        self.latencies[route].append(time.perf_counter() - started)
+        self.statuses[route][response.status] += 1
+        return response, body
+
+    def report(self, elapsed):
+        def summary(latencies):
+            latencies = sorted(latencies)
+            return {
+                'requests': len(latencies),
+                'rps': len(latencies) / elapsed,
+                'p50_ms': latencies[len(latencies) // 2] * 1000,
+                'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            }
+
+        routes = {route: dict(summary(latencies), statuses=dict(self.statuses[route]))
+                  for route, latencies in self.latencies.items() if latencies}
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        return dict(summary(everything) if everything else {'requests': 0}, seconds=elapsed, routes=routes)
+
+
+def ser_type_of(response):
+    return BINARY if response.headers.get('Content-Type', '').startswith('application/octet-stream') else JSON
+
+
+async def player(session, base, recorder, deadline, poll_interval):
+    address = f'0x{uuid.uuid4().hex}'
+    while True:
+        response, body = await recorder.request(session, 'POST', 'join', f'{base}/join', json={'address': address})
+        if response.status != 503:
+            break
+        await asyncio.sleep(1)
+    if response.status != 200:
+        return
+    joined = json.loads(body)
+    game_id, player_id, token = joined['game_id'], joined['player_id'], joined['player_token']
+
+    state = None
+    while time.monotonic() < deadline:
+        response, body = await recorder.request(session, 'GET', 'get_game_state', f'{base}/get_game_state/{game_id}')
+        if response.status != 200:
+            return
+        state = json.loads(body)
+        if state['started']:
+            break
+        await asyncio.sleep(poll_interval)
+    else:
+        return
+
+    response, context = await recorder.request(session, 'GET', 'get_crypto_context', f'{base}/get_crypto_context/{game_id}')
+    cc = await asyncio.to_thread(DeserializeCryptoContextString, context, ser_type_of(response))
+    response, key = await recorder.request(session, 'GET', 'get_pubkey', f'{base}/get_pubkey/{game_id}')
+    public_key = await asyncio.to_thread(DeserializePublicKeyString, key, ser_type_of(response))
+    response, share = await recorder.request(session, 'GET', 'get_key_share', f'{base}/get_key_share/{game_id}/{player_id}',
+                                             headers={'X-Player-Token': token})
+    secret_key = await asyncio.to_thread(DeserializePrivateKeyString, share, ser_type_of(response))
+
+    decrypted_stage = 0
+    while time.monotonic() < deadline and not state['finished']:
+        if state['is_decryption_stage'] and state['current_stage'] - 1 > decrypted_stage:
+            decrypted_stage = stage = state['current_stage'] - 1
+            ciphertexts = []
+            for index in range(state['players'] - 1):
+                response, payload = await recorder.request(session, 'GET', 'get_decryption_input',
+                                                           f'{base}/get_decryption_input/{game_id}/{stage}/{index}')
+                ciphertexts.append(await asyncio.to_thread(DeserializeCiphertextString, payload, ser_type_of(response)))
+            decrypt = cc.MultipartyDecryptLead if player_id == 1 else cc.MultipartyDecryptMain
+            partials = await asyncio.to_thread(decrypt, ciphertexts, secret_key)
+            form = aiohttp.FormData({'game_id': game_id, 'player_id': str(player_id), 'stage': str(stage)})
+            for i, partial in enumerate(partials):
+                form.add_field('partial_decryption', Serialize(partial, BINARY), filename=f'share-{i}',
+                               content_type='application/octet-stream')
+            await recorder.request(session, 'POST', 'decryption', f'{base}/decryption', data=form)
+            await recorder.request(session, 'GET', 'decryption_result', f'{base}/decryption_result/{game_id}/{stage}',
+                                   params={'player_id': player_id, 'wait': 30})
+        elif not state['is_decryption_stage'] and state['current_turn'] == player_id:
+            vector = [player_id, player_id] if state['current_stage'] == 1 else [1, 0]
+            ciphertext = await asyncio.to_thread(lambda: Serialize(cc.Encrypt(public_key, cc.MakePackedPlaintext(vector)), BINARY))
+            await recorder.request(session, 'POST', 'move', f'{base}/move', data=ciphertext,
+                                   params={'game_id': game_id, 'player_id': player_id},
+                                   headers={'Content-Type': 'application/octet-stream'})
+        else:
+            await asyncio.sleep(poll_interval)
+
+        response, body = await recorder.request(session, 'GET', 'get_game_state', f'{base}/get_game_state/{game_id}')
+        if response.status != 200:
+            return
+        state = json.loads(body)
+
+
+async def run_load(base, clients, duration, poll_interval):
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + duration
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(*(player(session, base, recorder, deadline, poll_interval) for _ in range(clients)),
+                                       return_exceptions=True)
+    report = recorder.report(time.monotonic() - started)
+    report['client_errors'] = sum(isinstance(result, Exception) for result in results)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, help='name=base_url, repeatable')
+    parser.add_argument('--clients', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds per run')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between state polls')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, base = target.partition('=')
+        for clients in args.clients:
+            report = asyncio.run(run_load(base.rstrip('/'), clients, args.duration, args.poll_interval))
+            results.append(dict(report, target=name, clients=clients))
+            print(f"{name:<6} clients={clients:<5} requests={report['requests']:<7} "
+                  f"rps={report.get('rps', 0):8.1f} p50={report.get('p50_ms', 0):7.1f}ms "
+                  f"p99={report.get('p99_ms', 0):8.1f}ms errors={report['client_errors']}")
+            for route, stats in sorted(report['routes'].items()):
+                print(f"    {route:<22} {stats['requests']:>7} req {stats['rps']:8.1f}/s "
+                      f"p50={stats['p50_ms']:7.1f}ms p99={stats['p99_ms']:8.1f}ms {stats['statuses']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
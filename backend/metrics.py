@@ -0,0 +1,62 @@
+"""Prometheus metrics of the game API, served on /metrics by app.py and asgi_app.py.
+
+Request and FHE timings are histograms, so percentiles can be computed over
+any window on the Prometheus side; counters and gauges cover ciphertext bytes,
+rooms, event streams and executor load. Timings of single OpenFHE operations
+are measured inside the worker processes (see `fhe_worker.timed`) and arrive
+here with the job result, so everything is exported by the app process.
+
+Logging goes through `logging`; LOG_LEVEL (default WARNING) sets the level, and
+a disabled level costs one integer comparison per call.
+"""
+import logging
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+latency_buckets = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+fhe_buckets = (.0001, .0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+request_seconds = Histogram('hns_http_request_seconds', 'Time to handle an HTTP request',
+                            ['route', 'method', 'status'], buckets=latency_buckets)
+fhe_op_seconds = Histogram('hns_fhe_op_seconds', 'Time of one OpenFHE operation inside a worker',
+                           ['op'], buckets=fhe_buckets)
+fhe_job_seconds = Histogram('hns_fhe_job_seconds', 'Queue wait and run time of executor jobs',
+                            ['job', 'phase'], buckets=fhe_buckets)
+fhe_jobs_failed = Counter('hns_fhe_jobs_failed_total', 'Executor jobs that raised inside their worker', ['job'])
+turn_seconds = Histogram('hns_turn_seconds', "From announcing a turn to that player's move arriving",
+                         buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120))
+ciphertext_bytes = Counter('hns_ciphertext_bytes_total', 'Serialized FHE objects received and sent',
+                           ['direction', 'kind'])
+rooms = Gauge('hns_rooms', 'Rooms in memory, by whether they wait for players, play or have finished', ['status'])
+event_streams = Gauge('hns_event_streams', 'Open /events streams')
+fhe_in_flight = Gauge('hns_fhe_in_flight', 'Executor jobs queued or running')
+
+
+def configure_logging():
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+def watch(registry, executor):
+    """Read the room and executor gauges from their owners at scrape time."""
+    rooms.labels('open').set_function(registry.open_count)
+    rooms.labels('finished').set_function(registry.retired_count)
+    rooms.labels('playing').set_function(lambda: len(registry) - registry.open_count() - registry.retired_count())
+    fhe_in_flight.set_function(lambda: sum(executor.stats()['in_flight']))
+
+
+def observe_fhe_job(job, queue_seconds, run_seconds, timings, failed):
+    """FheExecutor observer: one job's queue and run time, plus the operation timings its worker took."""
+    if failed:
+        fhe_jobs_failed.labels(job).inc()
+    fhe_job_seconds.labels(job, 'queue').observe(queue_seconds)
+    fhe_job_seconds.labels(job, 'run').observe(run_seconds)
+    for op, seconds in timings:
+        fhe_op_seconds.labels(op).observe(seconds)
+
+
+def exposition():
+    """Return (body, content type) of the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
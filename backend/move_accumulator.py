@@ -0,0 +1,33 @@
+class MoveAccumulator:
+    """Queues each player's move ciphertexts and folds them into their position once per stage.
+
+    /move only appends to the player's queue; the additions happen in one
+    EvalAddMany per player when the stage ends, which is the only point where
+    the summed positions are read.
+    """
+
+    def __init__(self, crypto_context, num_players):
+        self.crypto_context = crypto_context
+        self.positions = [None] * num_players  # encrypted [x, y] per player, as of the last fold
+        self.pending = [[] for _ in range(num_players)]
+
+    def push(self, player_index, ciphertext):
+        self.pending[player_index].append(ciphertext)
+
+    def fold(self):
+        """Add every queued move into its player's position and return the positions."""
+        for i, moves in enumerate(self.pending):
+            if not moves:
+                continue
+            if self.positions[i] is not None:
+                moves.insert(0, self.positions[i])
+            self.positions[i] = sum_ciphertexts(self.crypto_context, moves)
+            self.pending[i] = []
+        return self.positions
+
+
+def sum_ciphertexts(cc, ciphertexts):
+    if len(ciphertexts) == 1:
+        return ciphertexts[0]
+    return cc.EvalAddMany(ciphertexts)
+
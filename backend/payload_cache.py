@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+
+def supported_encodings():
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best content coding the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachedPayload:
+    """Serialized bytes of an object that never changes for the lifetime of a game.
+
+    The body, its ETag and each compressed variant are computed once; serving
+    it again only costs an ETag comparison and writing the stored bytes.
+    """
+
+    def __init__(self, body, content_type):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = bytes(body)
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.body)
+
+    def encoded(self, encoding):
+        if encoding is None:
+            return self.body
+
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    if encoding == 'zstd':
+                        body = zstandard.ZstdCompressor(level=3).compress(self.body)
+                    else:
+                        body = gzip.compress(self.body, compresslevel=6, mtime=0)
+                    self._encoded[encoding] = body
+        return body
+
+    def serve(self, if_none_match=None, accept_encoding=None):
+        """Return (status, headers, body) for a conditional, content-negotiated GET."""
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': 'private, no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if etag_matches(if_none_match, self.etag):
+            return 304, headers, b''
+
+        encoding = negotiate_encoding(accept_encoding)
+        body = self.encoded(encoding)
+        headers['Content-Type'] = self.content_type
+        headers['Content-Length'] = str(len(body))
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, body
@@ -0,0 +1,66 @@
+from openfhe import *
+
+
+ser_types = {
+    'json': JSON,
+    'binary': BINARY,
+}
+
+content_types = {
+    'json': 'application/json',
+    'binary': 'application/octet-stream',
+}
+
+
+def ser_type_name(ser_type):
+    return 'binary' if ser_type == BINARY else 'json'
+
+
+def ser_type_from_name(name):
+    try:
+        return ser_types[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown serialization type {name!r}, expected one of {sorted(ser_types)}")
+
+
+def ser_type_from_content_type(mimetype):
+    return BINARY if mimetype == content_types['binary'] else JSON
+
+
+def content_type_for(ser_type):
+    return content_types[ser_type_name(ser_type)]
+
+
+def serialize(obj, ser_type):
+    """Serialize an OpenFHE object to bytes in memory, without a temp file."""
+    data = Serialize(obj, ser_type)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return data
+
+
+def deserialize_ciphertext(data, ser_type):
+    if ser_type == JSON and isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    elif ser_type == BINARY and not isinstance(data, bytes):
+        data = bytes(data)
+    return DeserializeCiphertextString(data, ser_type)
+
+
+def serialize_eval_keys(cc, ser_type, key_tag=""):
+    """Serialize the context's EvalMult and EvalSum (automorphism) keys; the context itself does not carry them."""
+    mult = cc.SerializeEvalMultKeyString(ser_type, key_tag)
+    automorphism = cc.SerializeEvalAutomorphismKeyString(ser_type, key_tag)
+    return {
+        'mult': mult.encode('utf-8') if isinstance(mult, str) else mult,
+        'automorphism': automorphism.encode('utf-8') if isinstance(automorphism, str) else automorphism,
+    }
+
+
+def load_eval_keys(cc, eval_keys, ser_type):
+    for name, load in (('mult', cc.DeserializeEvalMultKeyString), ('automorphism', cc.DeserializeEvalAutomorphismKeyString)):
+        data = eval_keys[name]
+        if ser_type == JSON and isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if not load(data, ser_type):
+            raise RuntimeError(f'Failed to deserialize the {name} eval keys')
@@ -0,0 +1,250 @@
+"""Batched on-chain settlement of finished games.
+
+Finished rooms hand their result to a SettlementQueue instead of sending a
+transaction each. A daemon thread flushes the queue as one contract call
+(`settleGames(bytes32[] keys, uint8[] winners)` by default) as soon as
+`max_batch` results are waiting or the oldest one has waited `max_wait`
+seconds. The idempotency key of a result is the keccak hash of its game id:
+the queue drops a key it already holds or settled, and the contract is
+expected to ignore keys it has seen, so a retried batch never pays twice.
+
+Only transport failures and nonce races are retried: a batch that still hits
+one after `max_retries` quick retries goes back to the front of the queue, and
+the queue backs off (doubling up to `max_backoff` seconds) before sending
+again, so results survive a node or chain outage as long as the process runs.
+A revert (in estimateGas or a receipt with status 0) would fail the same way
+every time, so a reverting batch is split in halves until the reverting games
+are found; those go to a dead-letter list (see `metrics`) and the rest settle.
+"""
+import collections
+import logging
+import threading
+import time
+
+from web3 import Web3
+from web3.exceptions import TimeExhausted
+
+
+log = logging.getLogger(__name__)
+
+
+# Winner codes as stored on chain.
+winners = {'hider': 1, 'seeker': 2}
+
+settlement_abi = [{
+    'name': 'settleGames',
+    'type': 'function',
+    'stateMutability': 'nonpayable',
+    'inputs': [{'name': 'keys', 'type': 'bytes32[]'}, {'name': 'winners', 'type': 'uint8[]'}],
+    'outputs': [],
+}]
+
+Settlement = collections.namedtuple('Settlement', ['key', 'game_id', 'winner', 'queued_at'])
+
+
+def idempotency_key(game_id):
+    return Web3.keccak(text=game_id)
+
+
+class SettlementReverted(RuntimeError):
+    pass
+
+
+def is_retryable(error):
+    """Transport failures (requests' errors are OSErrors) and nonce races; anything else fails again the same way."""
+    if isinstance(error, (OSError, TimeExhausted)):
+        return True
+    return isinstance(error, ValueError) and 'nonce' in str(error).lower()
+
+
+class SettlementQueue:
+    def __init__(self, gateway, private_key, contract_address, abi=settlement_abi, function_name='settleGames',
+                 max_batch=32, max_wait=5.0, max_retries=3, retry_delay=1.0, max_backoff=300.0,
+                 confirm_timeout=120, settled_window=100000, dead_letter_size=1000):
+        self.gateway = gateway
+        self.private_key = private_key
+        self.contract_address = contract_address
+        self.abi = abi
+        self.function_name = function_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.confirm_timeout = confirm_timeout
+
+        self._pending = collections.OrderedDict()  # key -> Settlement
+        self._settled = collections.OrderedDict()  # key -> transaction hash, the newest `settled_window`
+        self._settled_window = settled_window
+        self._in_flight = set()
+        self.dead_letters = collections.deque(maxlen=dead_letter_size)  # games whose settlement reverts, newest last
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._backoff = 0.0  # seconds of the current backoff, 0 while batches go through
+        self._resume_at = 0.0  # monotonic time before which nothing is sent
+
+        self.submitted = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.settled = 0
+        self.retries = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self._batch_sizes = collections.deque(maxlen=256)
+        self._confirm_latencies = collections.deque(maxlen=256)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='settlement', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Flush whatever is queued, then stop the flush thread.
+
+        While backing off after a failed batch nothing more is sent; whatever is
+        still queued then stays unsettled (and is logged).
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, game_id, winner):
+        """Queue a finished game. Returns False if that game is already queued or settled."""
+        key = idempotency_key(game_id)
+        with self._cond:
+            if key in self._pending or key in self._in_flight or key in self._settled:
+                self.duplicates += 1
+                return False
+            self._pending[key] = Settlement(key, game_id, winners[winner], time.monotonic())
+            self.submitted += 1
+            self._cond.notify_all()
+        return True
+
+    def metrics(self):
+        sizes = list(self._batch_sizes)
+        latencies = list(self._confirm_latencies)
+        return {
+            'depth': len(self._pending),
+            'in_flight': len(self._in_flight),
+            'submitted': self.submitted,
+            'duplicates': self.duplicates,
+            'batches': self.batches,
+            'settled': self.settled,
+            'retries': self.retries,
+            'failed': self.failed,
+            'dead_lettered': self.dead_lettered,
+            'dead_letters': list(self.dead_letters),
+            'backoff_seconds': self._backoff,
+            'avg_batch_size': sum(sizes) / len(sizes) if sizes else None,
+            'confirm_latency_avg': sum(latencies) / len(latencies) if latencies else None,
+            'confirm_latency_max': max(latencies) if latencies else None,
+        }
+
+    def _take_batch(self):
+        """Wait for a full batch or for the oldest result to time out; called with the lock held."""
+        while True:
+            if self._pending:
+                backing_off = self._resume_at - time.monotonic()
+                if backing_off > 0:
+                    if self._stopped:
+                        log.warning("Stopping with %d games unsettled", len(self._pending))
+                        return None
+                    self._cond.wait(backing_off)
+                    continue
+                oldest = next(iter(self._pending.values())).queued_at
+                wait = oldest + self.max_wait - time.monotonic()
+                if len(self._pending) >= self.max_batch or wait <= 0 or self._stopped:
+                    break
+                self._cond.wait(wait)
+            elif self._stopped:
+                return None
+            else:
+                self._cond.wait()
+
+        batch = []
+        while self._pending and len(batch) < self.max_batch:
+            batch.append(self._pending.popitem(last=False)[1])
+        self._in_flight.update(item.key for item in batch)
+        return batch
+
+    def _send(self, batch):
+        started = time.monotonic()
+        tx_hash = self.gateway.transact_contract(self.private_key, self.contract_address, self.abi, self.function_name,
+                                                 [item.key for item in batch], [item.winner for item in batch])
+        receipt = self.gateway.wait_for_receipt(tx_hash, self.confirm_timeout)
+        if not receipt['status']:
+            raise SettlementReverted(f'Settlement transaction {tx_hash} reverted')
+        self._confirm_latencies.append(time.monotonic() - started)
+        return tx_hash
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if batch is None:
+                return
+            self._settle(batch)
+
+    def _send_with_retries(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._send(batch)
+            except Exception as e:
+                log.error("Settlement of %d games failed (attempt %d): %s", len(batch), attempt + 1, e)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _settle(self, batch):
+        """Send a batch, splitting it while it reverts; stops and requeues the rest when the chain cannot be reached."""
+        parts = [batch]
+        while parts:
+            part = parts.pop(0)
+            try:
+                tx_hash = self._send_with_retries(part)
+            except Exception as e:
+                with self._cond:
+                    if is_retryable(e):
+                        rest = [item for p in [part] + parts for item in p]
+                        self._in_flight.difference_update(item.key for item in rest)
+                        self._requeue(rest)
+                        return
+                    if len(part) > 1:
+                        half = len(part) // 2
+                        parts[0:0] = [part[:half], part[half:]]
+                        continue
+                    self._in_flight.discard(part[0].key)
+                    self._dead_letter(part[0], e)
+                continue
+
+            with self._cond:
+                self._in_flight.difference_update(item.key for item in part)
+                self._backoff = 0.0
+                for item in part:
+                    self._settled[item.key] = tx_hash
+                while len(self._settled) > self._settled_window:
+                    self._settled.popitem(last=False)
+                self.batches += 1
+                self.settled += len(part)
+                self._batch_sizes.append(len(part))
+
+    def _dead_letter(self, item, error):
+        """Give up on a game whose settlement reverts; called with the lock held."""
+        self.dead_lettered += 1
+        self.dead_letters.append({'game_id': item.game_id, 'winner': item.winner, 'error': str(error)})
+        log.error("Settlement of game %s reverts; moved to the dead letters: %s", item.game_id, error)
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front of the queue and back off; called with the lock held."""
+        self.failed += len(batch)
+        for item in reversed(batch):
+            self._pending[item.key] = item
+            self._pending.move_to_end(item.key, last=False)
+        self._backoff = min(self.max_backoff, max(self._backoff * 2, self.retry_delay * 2 ** (self.max_retries + 1)))
+        self._resume_at = time.monotonic() + self._backoff
+        log.warning("Requeued %d games; next settlement attempt in %.1fs", len(batch), self._backoff)
@@ -0,0 +1,158 @@
+"""Headless simulation of the FHE game API under load, with server resource usage.
+
+Starts the Flask app (app.py) or the ASGI app (asgi_app.py) as a local
+process, then runs thousands of scripted players against it with the
+load_test.py player: each joins, fetches its keys, sends encrypted moves on
+its turns and takes part in every threshold decryption. While the players run,
+the server process and its FHE workers are sampled for CPU and memory.
+
+Reported per run: moves/sec, turn latency (POST /move until the server has
+taken the move and passed the turn on) at p50/p95/p99, overall request rate,
+and the server's average and peak CPU and peak resident memory.
+
+    python simulate.py --server flask --agents 1000 2000 --duration 120 --json sim.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import requests
+
+from load_test import run_load
+
+
+servers = {
+    'flask': lambda port: [sys.executable, '-m', 'flask', 'run', '--port', str(port), '--no-reload', '--with-threads'],
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--port', str(port), '--workers', '1'],
+}
+
+
+class ResourceSampler:
+    """Samples CPU and resident memory of a process and all of its children on a thread."""
+
+    def __init__(self, pid, interval=0.5):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._processes = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        try:
+            current = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        cpu = rss = 0.0
+        for process in current:
+            # Keep one Process per pid so cpu_percent measures since the previous sample.
+            process = self._processes.setdefault(process.pid, process)
+            try:
+                cpu += process.cpu_percent(None)
+                rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                self._processes.pop(process.pid, None)
+        self.cpu.append(cpu)
+        self.rss.append(rss)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()  # primes cpu_percent
+        self.cpu.clear()
+        self.rss.clear()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def report(self):
+        return {
+            'cpu_avg_percent': sum(self.cpu) / len(self.cpu) if self.cpu else None,
+            'cpu_max_percent': max(self.cpu, default=None),
+            'rss_max_mb': max(self.rss) / 2 ** 20 if self.rss else None,
+        }
+
+
+def start_server(name, port, env):
+    server = subprocess.Popen(servers[name](port), cwd=os.path.dirname(os.path.abspath(__file__)),
+                              env=dict(os.environ, FLASK_APP='app', **env),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    # The context pool builds its first games before the app answers.
+    for _ in range(600):
+        if server.poll() is not None:
+            raise RuntimeError(f'{name} server exited with {server.returncode}')
+        try:
+            requests.get(f'{base}/metrics/context_pool', timeout=1)
+            return server, base
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f'{name} server did not start')
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def simulate(name, agents, duration, poll_interval, port, env):
+    server, base = start_server(name, port, env)
+    try:
+        with ResourceSampler(server.pid) as sampler:
+            report = asyncio.run(run_load(base, agents, duration, poll_interval))
+    finally:
+        stop_server(server)
+
+    moves = report['routes'].get('move', {})
+    return dict(moves, server=name, agents=agents,
+                moves_per_second=moves.get('requests', 0) / report['seconds'],
+                requests_per_second=report.get('rps', 0), client_errors=report['client_errors'],
+                **sampler.report(), routes=report['routes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', nargs='+', choices=sorted(servers), default=['flask'])
+    parser.add_argument('--agents', nargs='+', type=int, default=[1000])
+    parser.add_argument('--duration', type=float, default=120.0, help='seconds per run')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between state polls')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--env', action='append', default=[], help='NAME=value for the server, repeatable')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+    env = dict(item.split('=', 1) for item in args.env)
+
+    rows = []
+    for name in args.server:
+        for agents in args.agents:
+            row = simulate(name, agents, args.duration, args.poll_interval, args.port, env)
+            rows.append(row)
+            print(f"{name:<6} agents={agents:<6} moves/s={row['moves_per_second']:7.1f} "
+                  f"turn p50={row.get('p50_ms', 0):7.1f}ms p95={row.get('p95_ms', 0):7.1f}ms p99={row.get('p99_ms', 0):8.1f}ms "
+                  f"req/s={row['requests_per_second']:8.1f} cpu avg={row['cpu_avg_percent'] or 0:6.1f}% "
+                  f"max={row['cpu_max_percent'] or 0:6.1f}% rss={row['rss_max_mb'] or 0:7.1f}MB errors={row['client_errors']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Packing several players' positions into the slots of one ciphertext.
+
+A move only uses 2 of the `batch_size` slots of a packed plaintext. A
+SlotLayout hands every (room, player) its own 2-slot range, and a
+PackedMoveEngine adds all their moves into one shared accumulator, so one
+EvalAddMany and one threshold decryption serve every room in the layout.
+
+Everything in one layout has to be encrypted under the same public key and
+decrypted by the same key holders, so a layout spans rooms that share a crypto
+context (bot tables, simulations, a server-trusted shard), not independent
+threshold games. Rooms of the game API each have their own threshold keys
+(see context_pool.py), so packing across them cannot be used there: packing
+that ships in the game has to be within one room, a layout per room holding
+only that room's players under its keys.
+"""
+from move_accumulator import sum_ciphertexts
+
+
+class SlotLayout:
+    """Assigns fixed slot ranges of `slots_per_player` slots to (room, player) pairs."""
+
+    def __init__(self, batch_size, slots_per_player=2):
+        self.batch_size = batch_size
+        self.slots_per_player = slots_per_player
+        self._free = list(range(batch_size // slots_per_player - 1, -1, -1))
+        self._offsets = {}  # (room_id, player_index) -> first slot
+
+    @property
+    def capacity(self):
+        return self.batch_size // self.slots_per_player
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def assign(self, room_id, num_players):
+        """Reserve a range for each player of a room and return their offsets."""
+        if len(self._free) < num_players:
+            raise ValueError(f'Layout is full: {len(self._free)} free player ranges, {num_players} needed')
+        offsets = []
+        for player_index in range(num_players):
+            offset = self._free.pop() * self.slots_per_player
+            self._offsets[(room_id, player_index)] = offset
+            offsets.append(offset)
+        return offsets
+
+    def release(self, room_id):
+        for key in [key for key in self._offsets if key[0] == room_id]:
+            self._free.append(self._offsets.pop(key) // self.slots_per_player)
+
+    def offset(self, room_id, player_index):
+        return self._offsets[(room_id, player_index)]
+
+    def place(self, vector, room_id, player_index):
+        """Spread `vector` into a full-width slot vector at the player's range, for encryption by the client."""
+        offset = self.offset(room_id, player_index)
+        slots = [0] * (offset + len(vector))
+        slots[offset:] = vector
+        return slots
+
+    def unpack(self, values):
+        """Split decrypted slot values back into {room_id: {player_index: vector}}."""
+        rooms = {}
+        for (room_id, player_index), offset in self._offsets.items():
+            rooms.setdefault(room_id, {})[player_index] = list(values[offset:offset + self.slots_per_player])
+        return rooms
+
+
+class PackedMoveEngine:
+    """One packed position accumulator for every player in a SlotLayout.
+
+    Moves have to arrive already placed in their player's slot range (the
+    client encrypts `SlotLayout.place(...)`), so they are only added: the
+    contexts are built without rotation keys, and with the multiplicative depth
+    of the game profile, which a mask-and-rotate on the server would use up.
+    """
+
+    def __init__(self, crypto_context, layout):
+        self.crypto_context = crypto_context
+        self.layout = layout
+        self.positions = None
+        self.pending = []
+
+    def push(self, ciphertext):
+        """Queue a move encrypted at its player's slot range."""
+        self.pending.append(ciphertext)
+
+    def fold(self):
+        """Add every queued move of every room into the shared accumulator with one EvalAddMany."""
+        if self.pending:
+            if self.positions is not None:
+                self.pending.insert(0, self.positions)
+            self.positions = sum_ciphertexts(self.crypto_context, self.pending)
+            self.pending = []
+        return self.positions
@@ -0,0 +1,37 @@
+"""Smoke test of the ASGI app: requests go through the timing middleware and the error handlers.
+
+    python -m pytest test_asgi_app.py
+"""
+import os
+
+import pytest
+
+pytest.importorskip('openfhe')
+pytest.importorskip('httpx')
+fastapi_testclient = pytest.importorskip('fastapi.testclient')
+
+# One worker and no pooled contexts, so importing the app does not generate keys.
+os.environ.setdefault('FHE_WORKERS', '1')
+os.environ.setdefault('FHE_KEYGEN_WORKERS', '1')
+os.environ.setdefault('CONTEXT_POOL_SIZE', '0')
+
+import asgi_app  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def client():
+    with fastapi_testclient.TestClient(asgi_app.app) as client:
+        yield client
+
+
+def test_request_is_timed(client):
+    response = client.get('/metrics/turns')
+    assert response.status_code == 200
+    assert 'hns_http_request_seconds' in client.get('/metrics').text
+
+
+def test_unknown_game_is_404(client):
+    response = client.get('/get_game_state/unknown')
+    assert response.status_code == 404
+    assert response.json() == {'error': 'Unknown game unknown'}
+
@@ -0,0 +1,145 @@
+"""Search for the smallest secure BGVrns parameters that still run the game circuit correctly.
+
+Every candidate profile runs the full server circuit once: two-party keygen
+with joint eval keys, encrypting both positions, adding a move, the encrypted
+proximity (EvalSub, EvalMult, EvalSum) and a Lead/Main/Fusion decryption. The
+decrypted squared distance is checked, and latency of each phase plus the
+ciphertext size is reported. The winner can be passed to the server as
+FHE_PROFILE='<json>'.
+
+    python tune_params.py --board-size 6 --tile-size 1 --security 128 --output profiles.json
+"""
+import argparse
+import json
+import time
+
+from openfhe import *
+
+from context_pool import create_game_crypto
+from fhe_params import profiles, required_plaintext_modulus
+from fhe_worker import encrypted_proximity
+from serialization import serialize
+
+
+def is_prime(n):
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+
+
+def smallest_batching_prime(minimum, ring_dimension):
+    """Smallest prime t >= minimum with t = 1 (mod 2N), which packed encoding needs."""
+    m = 2 * ring_dimension
+    t = ((minimum - 1 + m - 1) // m) * m + 1
+    while not is_prime(t):
+        t += m
+    return t
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - started
+
+
+def run_circuit(profile, board_size, tile_size):
+    crypto, keygen_seconds = timed(create_game_crypto, profile)
+    cc, public_key, key_pairs = crypto.crypto_context, crypto.public_key, crypto.key_pairs
+
+    span = (board_size - 1) * tile_size
+    hider_start, seeker_start, step = [0, 0], [span, span - tile_size], [tile_size, 0]
+
+    hider, encrypt_seconds = timed(cc.Encrypt, public_key, cc.MakePackedPlaintext(hider_start))
+    seeker = cc.Encrypt(public_key, cc.MakePackedPlaintext(seeker_start))
+    move = cc.Encrypt(public_key, cc.MakePackedPlaintext(step))
+
+    hider, add_seconds = timed(cc.EvalAdd, hider, move)
+    proximity, proximity_seconds = timed(encrypted_proximity, cc, hider, seeker, profile.batch_size)
+
+    started = time.perf_counter()
+    partials = [cc.MultipartyDecryptLead([proximity], key_pairs[0].secretKey)[0],
+                cc.MultipartyDecryptMain([proximity], key_pairs[1].secretKey)[0]]
+    plaintext = cc.MultipartyDecryptFusion(partials)
+    decrypt_seconds = time.perf_counter() - started
+    plaintext.SetLength(1)
+
+    dx, dy = hider_start[0] + step[0] - seeker_start[0], hider_start[1] + step[1] - seeker_start[1]
+    return {
+        'ring_dimension': cc.GetRingDimension(),
+        'correct': plaintext.GetPackedValue()[0] == dx * dx + dy * dy,
+        'ciphertext_bytes': len(serialize(hider, BINARY)),
+        'keygen_seconds': keygen_seconds,
+        'encrypt_seconds': encrypt_seconds,
+        'add_seconds': add_seconds,
+        'proximity_seconds': proximity_seconds,
+        'decrypt_fusion_seconds': decrypt_seconds,
+    }
+
+
+def evaluate(profile, board_size, tile_size):
+    row = {'profile': profile._asdict()}
+    try:
+        row.update(run_circuit(profile, board_size, tile_size))
+    except Exception as e:  # OpenFHE rejects insecure or unbatchable parameter sets
+        row.update(correct=False, error=str(e))
+    return row
+
+
+def candidates(args, minimum_modulus):
+    base = profiles['default']
+    for security in args.security:
+        for batch_size in args.batch_sizes:
+            for ring_dimension in args.ring_dimensions:
+                profile = base._replace(name='candidate', security_level=security, batch_size=batch_size,
+                                        ring_dimension=ring_dimension)
+                yield profile
+                if ring_dimension:
+                    t = smallest_batching_prime(minimum_modulus, ring_dimension)
+                    if t != profile.plaintext_modulus:
+                        yield profile._replace(plaintext_modulus=t)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--board-size', type=int, default=6)
+    parser.add_argument('--tile-size', type=int, default=1)
+    parser.add_argument('--security', nargs='+', default=['128'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[16])
+    parser.add_argument('--ring-dimensions', nargs='+', type=int, default=[0, 4096, 8192, 16384, 32768],
+                        help='0 lets OpenFHE pick the smallest ring for the security level')
+    parser.add_argument('--output', help='also write every evaluated profile as JSON to this file')
+    args = parser.parse_args()
+
+    minimum_modulus = required_plaintext_modulus(args.board_size, args.tile_size)
+    rows = [evaluate(profile, args.board_size, args.tile_size) for profile in candidates(args, minimum_modulus)]
+
+    print(f"plaintext modulus must be at least {minimum_modulus} for a {args.board_size}x{args.board_size} board")
+    print(f"{'security':>8} {'t':>8} {'N':>6} {'ct bytes':>9} {'keygen':>8} {'enc':>7} {'add':>7} {'prox':>7} {'dec':>7}  ok")
+    for row in rows:
+        profile = row['profile']
+        if 'error' in row:
+            print(f"{profile['security_level']:>8} {profile['plaintext_modulus']:>8} {profile['ring_dimension']:>6}  rejected: {row['error']}")
+            continue
+        print(f"{profile['security_level']:>8} {profile['plaintext_modulus']:>8} {row['ring_dimension']:>6} "
+              f"{row['ciphertext_bytes']:>9} {row['keygen_seconds'] * 1000:>7.0f}ms {row['encrypt_seconds'] * 1000:>5.1f}ms "
+              f"{row['add_seconds'] * 1000:>5.2f}ms {row['proximity_seconds'] * 1000:>5.1f}ms "
+              f"{row['decrypt_fusion_seconds'] * 1000:>5.1f}ms  {'yes' if row['correct'] else 'NO'}")
+
+    secure = [row for row in rows if row['correct'] and row['profile']['security_level'] != 'none']
+    if secure:
+        best = min(secure, key=lambda row: (row['ciphertext_bytes'], row['proximity_seconds'] + row['decrypt_fusion_seconds']))
+        overrides = {k: v for k, v in best['profile'].items() if k != 'name' and v != getattr(profiles['default'], k)}
+        print(f"smallest secure profile: FHE_PROFILE='{json.dumps(overrides)}'")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
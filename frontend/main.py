@@ -1,100 +1,255 @@
 from openfhe import *
+from move_table import MoveTable
+from object_cache import LazyObject, ObjectCache, default_cache_dir
+import asyncio
 import requests
 import json
+import os
+import threading
+import time
 
-serType = JSON 
-datafolder = "demodata"
+serType = BINARY
 
 player_id = 0 
-
-def main():
-    cc = get_crypto_context_from_server()
-    public_key = get_public_key_from_server()
-
-    direction = input("이동할 방향을 입력하세요 (up, down, left, right): ")
-    vector = direction_to_vector(direction)
-
-    ciphertext = encrypt_message(vector, public_key, cc)
-
-    send_to_server(ciphertext)
-
+game_id = None
+player_token = None  # from /join; proves to the server which key share is ours
+directions = ('up', 'down', 'left', 'right')
+cache = ObjectCache(os.environ.get('HIDE_N_SEEK_CACHE', default_cache_dir))
+
+async def main():
+    address = await asyncio.to_thread(input, "지갑 주소를 입력하세요: ")
+    if not await asyncio.to_thread(resume_game, address):
+        await asyncio.to_thread(join_game, address)
+        save_session(address)
+
+    # Nothing is downloaded or deserialized until the first turn needs it.
+    crypto_context = LazyObject(get_crypto_context_from_server)
+    # Keys can only be deserialized once their crypto context is.
+    public_key = LazyObject(get_public_key_from_server, crypto_context)
+    secret_key = LazyObject(get_key_share_from_server, crypto_context)
+
+    # The server pushes the room state on every change; no more polling.
+    events = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    threading.Thread(target=follow_game_events, args=(loop, events), daemon=True).start()
+
+    move_table = None
+    decrypted_stage = 0
     while True:
-        game_state = get_game_state_from_server()
-        if game_state['is_decryption_stage']:
-            perform_decryption_stage(cc)
-            break
+        game_state = await events.get()
+        while not events.empty():  # only the newest state matters
+            game_state = events.get_nowait()
 
-        direction = input("이동할 방향을 입력하세요 (up, down, left, right): ")
-        vector = direction_to_vector(direction)
-
-        ciphertext = encrypt_message(vector, public_key, cc)
-
-        send_to_server(ciphertext)
+        if game_state['finished']:
+            print(f"게임 종료: {game_state['winner']} 승리")
+            forget_session(address)
+            break
 
-        time.sleep(5)  # 5초마다 서버 상태 확인
+        if game_state['is_decryption_stage']:
+            stage = game_state['current_stage'] - 1
+            if stage <= decrypted_stage:
+                continue
+            decrypted_stage = stage
+            result = await asyncio.to_thread(perform_decryption_stage, crypto_context.get(), secret_key.get(), stage,
+                                             num_inputs=game_state['players'] - 1)
+            print(f"상대와의 거리의 제곱: {result['distance_squared']}")
+            if result['finished']:
+                print(f"게임 종료: {result['winner']} 승리")
+                forget_session(address)
+                break
+            if move_table:
+                print(f"미리 암호화된 이동: {move_table.metrics()}")
+            continue
+
+        if not game_state['started'] or game_state['current_turn'] != player_id:
+            continue
+
+        # The first move of a game is the starting position; every later one is a step from it.
+        if game_state['current_stage'] == 1:
+            line = await asyncio.to_thread(input, "시작 위치를 입력하세요 (x y): ")
+            vector = [int(v) for v in line.split()]
+            ciphertext = await asyncio.to_thread(encrypt_message, vector, public_key.get(), crypto_context.get())
+        else:
+            if move_table is None:
+                move_table = start_move_table(crypto_context.get(), public_key.get())
+            direction = await asyncio.to_thread(input, "이동할 방향을 입력하세요 (up, down, left, right): ")
+            ciphertext = move_table.take(direction)
+
+        await asyncio.to_thread(send_to_server, ciphertext)
+
+        # Fill the direction queues while the other players take their turns.
+        if move_table is None:
+            move_table = start_move_table(crypto_context.get(), public_key.get())
+
+def follow_game_events(loop, events):
+    """Read the game's Server-Sent Events stream and hand each state to the event loop, reconnecting if it drops."""
+    last_event_id = None
+    while True:
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+        try:
+            with requests.get(f'http://127.0.0.1:5000/events/{game_id}', headers=headers, stream=True) as response:
+                if response.status_code != 200:
+                    return  # the game is over and gone
+                data = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('id:'):
+                        last_event_id = line[3:].strip()
+                    elif line.startswith('data:'):
+                        data = line[5:].strip()
+                    elif not line and data:
+                        game_state = json.loads(data)
+                        loop.call_soon_threadsafe(events.put_nowait, game_state)
+                        data = None
+                        if game_state['finished']:
+                            return
+        except requests.RequestException:
+            time.sleep(1)
+
+def join_game(address, requested_game_id=None):
+    global player_id, game_id, player_token
+
+    response = requests.post('http://127.0.0.1:5000/join', json={'address': address, 'game_id': requested_game_id})
+    if response.status_code != 200:
+        raise Exception("Failed to join a game")
+
+    player_id = response.json()['player_id']
+    game_id = response.json()['game_id']
+    player_token = response.json()['player_token']
+    print(f"Joined game {game_id} as player {player_id}")
+
+def session_path():
+    return os.path.join(cache.root, 'sessions.json')
+
+def read_sessions():
+    try:
+        with open(session_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_session(address):
+    sessions = read_sessions()
+    sessions[address] = {'game_id': game_id, 'player_id': player_id, 'player_token': player_token}
+    with open(session_path(), 'w') as f:
+        json.dump(sessions, f)
+
+def forget_session(address):
+    sessions = read_sessions()
+    session = sessions.pop(address, None)
+    with open(session_path(), 'w') as f:
+        json.dump(sessions, f)
+    if session:
+        cache.forget(session['game_id'])
+        cache.prune()
+
+def resume_game(address):
+    """Rejoin the unfinished game this address last played, if the server still has it."""
+    global player_id, game_id, player_token
+
+    session = read_sessions().get(address)
+    if not session or 'player_token' not in session:
+        return False
+    response = requests.get(f"http://127.0.0.1:5000/get_game_state/{session['game_id']}")
+    if response.status_code != 200 or response.json()['finished']:
+        forget_session(address)
+        return False
+
+    player_id, game_id, player_token = session['player_id'], session['game_id'], session['player_token']
+    print(f"Resumed game {game_id} as player {player_id}")
+    return True
 
 def get_crypto_context_from_server():
-    response = requests.get('http://127.0.0.1:5000/get_crypto_context')
-    if response.status_code != 200:
-        raise Exception("Failed to get crypto context from server")
-    
-    crypto_context_json = response.json()
-    cc = DeserializeCryptoContext(datafolder + "/cryptocontext.txt", serType)
-    return cc
+    # Cached by the server's ETag; a reconnect only revalidates and reads the context from disk.
+    return cache.fetch(game_id, 'crypto_context', f'http://127.0.0.1:5000/get_crypto_context/{game_id}',
+                       DeserializeCryptoContextString, response_payload)
 
 def get_public_key_from_server():
-    response = requests.get('http://127.0.0.1:5000/get_pubkey')
+    return cache.fetch(game_id, 'public_key', f'http://127.0.0.1:5000/get_pubkey/{game_id}',
+                       DeserializePublicKeyString, response_payload)
+
+def get_key_share_from_server():
+    response = requests.get(f'http://127.0.0.1:5000/get_key_share/{game_id}/{player_id}',
+                            headers={'X-Player-Token': player_token})
     if response.status_code != 200:
-        raise Exception("Failed to get public key from server")
-    
-    public_key_json = response.json()['public_key']
-    public_key = DeserializePublicKey(datafolder + "/key-public.txt", serType)
-    return public_key
+        raise Exception("Failed to get key share from server")
+
+    secret_key = DeserializePrivateKeyString(*response_payload(response))
+    return secret_key
+
+def response_payload(response):
+    """Return (data, serType) for a serialized object, in whichever format the server sent it."""
+    if response.headers.get('Content-Type', '').startswith('application/octet-stream'):
+        return response.content, BINARY
+    return response.text, JSON
 
 def direction_to_vector(direction):
     if direction == "up":
-        return [0, 0]
+        return [0, -1]
     elif direction == "down":
         return [0, 1]
     elif direction == "left":
-        return [1, 0]
+        return [-1, 0]
     elif direction == "right":
-        return [1, 1]
+        return [1, 0]
     else:
         raise ValueError("Invalid direction")
 
+def start_move_table(cc, public_key):
+    return MoveTable(cc, public_key, {d: direction_to_vector(d) for d in directions}).start()
+
 def encrypt_message(vector, public_key, cc):
     plaintext = cc.MakePackedPlaintext(vector)
     ciphertext = cc.Encrypt(public_key, plaintext)
     return ciphertext
 
 def send_to_server(ciphertext):
-    filepath = "/path/to/ciphertext.json"
-    if not SerializeToFile(filepath, ciphertext, "JSON"):
-        raise Exception("Error writing serialization of ciphertext to file")
-
-    with open(filepath, 'r') as file:
-        ciphertext_json = file.read()
+    payload = Serialize(ciphertext, serType)
 
-    response = requests.post('http://127.0.0.1:5000/move', json={'player_id': 1, 'ciphertext': ciphertext_json})
+    if serType == BINARY:
+        response = requests.post('http://127.0.0.1:5000/move', data=payload,
+                                 params={'game_id': game_id, 'player_id': player_id},
+                                 headers={'Content-Type': 'application/octet-stream'})
+    else:
+        response = requests.post('http://127.0.0.1:5000/move', json={'game_id': game_id, 'player_id': player_id, 'ciphertext': payload})
     if response.status_code != 200:
         raise Exception("Failed to send ciphertext to server")
 
     print("Ciphertext sent to server successfully")
 
-def get_game_state_from_server():
-    response = requests.get('http://127.0.0.1:5000/get_game_state')
+def perform_decryption_stage(cc, secret_key, stage, num_inputs=1):
+    print("Decryption stage started")
+
+    # The server only asks for the encrypted proximity of the hider to each seeker, never the positions.
+    ciphertexts = []
+    for index in range(num_inputs):
+        response = requests.get(f'http://127.0.0.1:5000/get_decryption_input/{game_id}/{stage}/{index}')
+        if response.status_code != 200:
+            raise Exception("Failed to get decryption input from server")
+        ciphertexts.append(DeserializeCiphertextString(*response_payload(response)))
+
+    # Player 1 holds the lead share; every other player runs the main partial decryption.
+    if player_id == 1:
+        partial_decryptions = cc.MultipartyDecryptLead(ciphertexts, secret_key)
+    else:
+        partial_decryptions = cc.MultipartyDecryptMain(ciphertexts, secret_key)
+
+    content_type = 'application/octet-stream' if serType == BINARY else 'application/json'
+    files = [('partial_decryption', (f'share-{i}', Serialize(partial, serType), content_type))
+             for i, partial in enumerate(partial_decryptions)]
+    response = requests.post('http://127.0.0.1:5000/decryption', files=files,
+                             data={'game_id': game_id, 'player_id': player_id, 'stage': stage})
     if response.status_code != 200:
-        raise Exception("Failed to get game state from server")
-    
-    return response.json()
+        raise Exception("Failed to send partial decryption to server")
 
-def perform_decryption_stage(cc, kp, ciphertext):
-    print("Decryption stage started")
-    # Decryption logic here
-    partial_decryption = cc.MultipartyDecryptLead([ciphertext], kp.secretKey)
-    response = requests.post('http://127.0.0.1:5000/decryption', json={'player_id': 1, 'partial_decryption': partial_decryption})
+    result = response.json()
+    while 'found' not in result:
+        response = requests.get(f'http://127.0.0.1:5000/decryption_result/{game_id}/{stage}',
+                                params={'player_id': player_id, 'wait': 30})
+        if response.status_code not in (200, 202):
+            raise Exception("Failed to get decryption result from server")
+        result = response.json()
+    return result
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
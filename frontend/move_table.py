@@ -0,0 +1,91 @@
+"""Pre-encrypted moves, so sending a direction never waits for public-key encryption.
+
+Only four direction vectors exist. A MoveTable keeps a queue of fresh
+encryptions of each one and a background thread tops the queues up while the
+player is thinking or waiting for the other players. Each ciphertext is used
+once: reusing one would let the server link identical moves.
+"""
+import collections
+import threading
+import time
+
+
+class MoveTable:
+    def __init__(self, cc, public_key, vectors, depth=4):
+        self.cc = cc
+        self.public_key = public_key
+        self.vectors = vectors
+        self.depth = depth
+
+        self._queues = {direction: collections.deque() for direction in vectors}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self.hits = 0
+        self.misses = 0
+        self.encryptions = 0
+        self.encrypt_seconds = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='move-table', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def take(self, direction):
+        """Return a never-used ciphertext of `direction`, encrypting inline only if its queue ran dry."""
+        if direction not in self._queues:
+            raise ValueError("Invalid direction")
+        with self._cond:
+            queue = self._queues[direction]
+            if queue:
+                self.hits += 1
+                ciphertext = queue.popleft()
+                self._cond.notify_all()
+                return ciphertext
+            self.misses += 1
+            self._cond.notify_all()
+        return self._encrypt(direction)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'depth': {direction: len(queue) for direction, queue in self._queues.items()},
+                'target_depth': self.depth,
+                'hits': self.hits,
+                'misses': self.misses,
+                'encryptions': self.encryptions,
+                'encryptions_per_second': self.encryptions / self.encrypt_seconds if self.encrypt_seconds else None,
+            }
+
+    def _encrypt(self, direction):
+        """Encrypt outside the lock; only the counters are updated under it, since take() and the thread both encrypt."""
+        started = time.perf_counter()
+        ciphertext = self.cc.Encrypt(self.public_key, self.cc.MakePackedPlaintext(self.vectors[direction]))
+        with self._cond:
+            self.encrypt_seconds += time.perf_counter() - started
+            self.encryptions += 1
+        return ciphertext
+
+    def _shortest(self):
+        direction = min(self._queues, key=lambda d: len(self._queues[d]))
+        return direction if len(self._queues[direction]) < self.depth else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._shortest() is None:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                direction = self._shortest()
+
+            ciphertext = self._encrypt(direction)
+            with self._cond:
+                self._queues[direction].append(ciphertext)
@@ -0,0 +1,123 @@
+"""Local cache of the serialized objects a game never changes: crypto context and public key.
+
+Objects are stored content-addressed under `objects/<sha256 of etag>.bin`,
+where the ETag is the server's hash of the payload (hashed again so no ETag
+can name a path outside the cache), and `games/<game_id>.json` maps each
+object name of a game to its ETag. A reconnecting client revalidates with
+If-None-Match and, on 304, loads the object from disk instead of downloading
+it again. Whatever format the server sent, the object is stored re-serialized
+as BINARY, so a cache hit never pays for JSON deserialization.
+
+Objects are fetched and deserialized on first use only.
+"""
+import hashlib
+import json
+import os
+
+import requests
+from openfhe import *
+
+
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'hide-n-seek')
+
+
+class ObjectCache:
+    def __init__(self, root=default_cache_dir):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'games'), exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _index_path(self, game_id):
+        return os.path.join(self.root, 'games', f'{game_id}.json')
+
+    def _object_path(self, etag):
+        return os.path.join(self.root, 'objects', hashlib.sha256(etag.encode('utf-8')).hexdigest() + '.bin')
+
+    def _read_index(self, game_id):
+        try:
+            with open(self._index_path(game_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, game_id, index):
+        path = self._index_path(game_id)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    def _read_object(self, etag):
+        try:
+            with open(self._object_path(etag), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_object(self, etag, data):
+        path = self._object_path(etag)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def fetch(self, game_id, name, url, deserialize, payload):
+        """Return the deserialized object `name` of `game_id`, from disk if the server's ETag still matches.
+
+        `payload(response)` turns a 200 response into the (data, serType)
+        arguments of `deserialize`.
+        """
+        etag = self._read_index(game_id).get(name)
+        data = self._read_object(etag) if etag else None
+
+        headers = {'If-None-Match': etag} if data is not None else {}
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304 and data is not None:
+            self.hits += 1
+            return deserialize(data, BINARY)
+        if response.status_code != 200:
+            raise Exception(f"Failed to get {name} from server")
+
+        self.misses += 1
+        obj = deserialize(*payload(response))
+        etag = response.headers.get('ETag')
+        if etag:
+            self._write_object(etag, Serialize(obj, BINARY))
+            index = self._read_index(game_id)
+            index[name] = etag
+            self._write_index(game_id, index)
+        return obj
+
+    def forget(self, game_id):
+        """Drop the index of a finished game; its objects stay until `prune()`."""
+        try:
+            os.remove(self._index_path(game_id))
+        except OSError:
+            pass
+
+    def prune(self):
+        """Delete every stored object no game index refers to any more."""
+        live = set()
+        for filename in os.listdir(os.path.join(self.root, 'games')):
+            if filename.endswith('.json'):
+                live.update(os.path.basename(self._object_path(etag))
+                            for etag in self._read_index(filename[:-len('.json')]).values())
+        for filename in os.listdir(os.path.join(self.root, 'objects')):
+            if filename not in live:
+                os.remove(os.path.join(self.root, 'objects', filename))
+
+
+class LazyObject:
+    """Loads an object the first time `get()` is called, after the LazyObjects it depends on, then keeps it."""
+
+    def __init__(self, load, *depends_on):
+        self._load = load
+        self._depends_on = depends_on
+        self._value = None
+
+    def get(self):
+        if self._value is None:
+            for dependency in self._depends_on:
+                dependency.get()
+            self._value = self._load()
+        return self._value
@@ -0,0 +1,103 @@
+"""Where match state lives, so several server processes can share it.
+
+A backend is a small key/value store of JSON-able documents with per-key
+locks and counters:
+
+- MemoryBackend keeps everything in this process (the default, one server).
+- RedisBackend keeps it in Redis, or anything speaking its protocol
+  (a local redis-server, fakeredis in a test), so every process sees the
+  same matches.
+
+Events between processes go through the Socket.IO message queue (see
+`message_queue_url`); the backend only holds state.
+"""
+import json
+import os
+import threading
+
+
+class MemoryBackend:
+    """Documents are kept as the objects themselves; callers mutate them only while holding their lock."""
+
+    def __init__(self):
+        self._data = {}
+        self._counters = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def lock(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value):
+        self._data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+            self._locks.pop(key, None)
+
+    def incr(self, key, amount=1):
+        with self._guard:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            return self._counters[key]
+
+    def counters(self, *keys):
+        return {key: self._counters.get(key, 0) for key in keys}
+
+
+class RedisBackend:
+    """Documents are stored as JSON strings; locks are Redis locks, so they hold across processes."""
+
+    def __init__(self, client, prefix="hns:", lock_timeout=10):
+        self.client = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def lock(self, key):
+        return self.client.lock(f"{self.prefix}lock:{key}", timeout=self.lock_timeout)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def incr(self, key, amount=1):
+        return self.client.incrby(f"{self.prefix}counter:{key}", amount)
+
+    def counters(self, *keys):
+        values = self.client.mget([f"{self.prefix}counter:{key}" for key in keys])
+        return {key: int(value or 0) for key, value in zip(keys, values)}
+
+
+def backend_from_url(url=None):
+    """`memory://` (or nothing) for one process, `redis://host:port/db` to share state between processes."""
+    if not url or url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"Unknown state backend: {url}")
+
+
+def message_queue_url(state_url=None):
+    """The Socket.IO message queue: MESSAGE_QUEUE if set, else the Redis state backend, else none (one process)."""
+    url = os.environ.get("MESSAGE_QUEUE")
+    if url:
+        return url
+    if state_url and not state_url.startswith("memory://"):
+        return state_url
+    return None
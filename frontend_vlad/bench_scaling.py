@@ -0,0 +1,89 @@
+"""Moves/sec of the Socket.IO game server at 1, 2 and 4 worker processes.
+
+For every process count, starts that many `server.py` processes on
+consecutive ports, all sharing one Redis (state backend and Socket.IO message
+queue), then runs the load_test.py match workload against all of them. With
+`--no-routing` the processes do not redirect /join to a match's owner, so the
+two players of most matches sit on different processes and every update
+crosses the message queue.
+
+Needs a Redis server (or anything speaking its protocol) at `--redis`:
+
+    python bench_scaling.py --redis redis://127.0.0.1:6379/0 --processes 1 2 4 --matches 50 --moves 40
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from load_test import run
+
+
+def start_workers(count, base_port, redis_url, routing):
+    urls = [f'http://127.0.0.1:{base_port + i}' for i in range(count)]
+    workers = []
+    for url in urls:
+        env = dict(os.environ, PORT=url.rsplit(':', 1)[1], WORKER_URL=url, STATE_BACKEND=redis_url, DEBUG='0',
+                   WORKERS=','.join(urls) if routing else '')
+        workers.append(subprocess.Popen([sys.executable, 'server.py'], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for url in urls:
+        for _ in range(100):
+            try:
+                requests.get(f'{url}/stats', timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+        else:
+            stop_workers(workers)
+            raise RuntimeError(f'Worker {url} did not start')
+    return urls, workers
+
+
+def stop_workers(workers):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.wait()
+
+
+def flush(redis_url):
+    import redis
+    redis.Redis.from_url(redis_url).flushdb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--redis', default='redis://127.0.0.1:6379/0', help='state backend and message queue')
+    parser.add_argument('--processes', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--matches', type=int, default=50)
+    parser.add_argument('--moves', type=int, default=40, help='moves per match')
+    parser.add_argument('--base-port', type=int, default=5101)
+    parser.add_argument('--no-routing', action='store_true', help='do not send players to the owner of their match')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rows = []
+    for count in args.processes:
+        flush(args.redis)
+        urls, workers = start_workers(count, args.base_port, args.redis, not args.no_routing)
+        try:
+            row = dict(run(urls, args.matches, args.moves), processes=count, routing=not args.no_routing)
+        finally:
+            stop_workers(workers)
+        rows.append(row)
+        print(f"processes={count:<2} matches={row['matches']:<5} moves={row['moves']:<6} rejected={row['rejected_moves']:<4} "
+              f"moves/s={row['moves_per_second']:8.1f} messages/move={row['messages_per_move'] or 0:.2f} "
+              f"split matches={row['split_matches']} gaps={row['gaps']} errors={len(row['errors'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
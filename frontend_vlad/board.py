@@ -0,0 +1,86 @@
+"""Server-side board: bounds, move legality and distances.
+
+A position is a single integer, `cell = y * width + x`. The Manhattan distance
+between every pair of cells is computed once per board size, so a distance
+or an adjacency check (distance == 1) is one table lookup. Single moves from
+the socket handlers use the flat Python table; batches of moves for bots and
+simulations (see `simulate.py --offline`) use the NumPy one.
+"""
+import numpy as np
+
+
+class Board:
+    def __init__(self, width=6, height=6):
+        self.width = width
+        self.height = height
+        self.cells = width * height
+
+        xs = np.arange(self.cells) % width
+        ys = np.arange(self.cells) // width
+        self.distances = (np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])).astype(np.int16)
+        self._distances = self.distances.ravel().tolist()
+
+    def encode(self, position):
+        """The cell of a `{"x": .., "y": ..}` position, or None if it is malformed or off the board."""
+        try:
+            x, y = position["x"], position["y"]
+        except (KeyError, TypeError):
+            return None
+        if type(x) is not int or type(y) is not int or not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        return y * self.width + x
+
+    def decode(self, cell):
+        return {"x": cell % self.width, "y": cell // self.width}
+
+    def distance(self, a, b):
+        return self._distances[a * self.cells + b]
+
+    def is_adjacent(self, a, b):
+        """A legal move goes exactly one step horizontally or vertically."""
+        return self._distances[a * self.cells + b] == 1
+
+    def move_batch(self, sources, targets):
+        """Check many moves at once; returns a bool array, True where the target is on the board and adjacent."""
+        sources = np.asarray(sources, dtype=np.intp)
+        targets = np.asarray(targets, dtype=np.intp)
+        on_board = (targets >= 0) & (targets < self.cells)
+        legal = on_board.copy()
+        legal[on_board] = self.distances[sources[on_board], targets[on_board]] == 1
+        return legal
+
+    def distance_batch(self, hiders, seekers):
+        return self.distances[np.asarray(hiders, dtype=np.intp), np.asarray(seekers, dtype=np.intp)]
+
+    def neighbours(self, cells):
+        """For each cell, its four neighbours as an (n, 4) array, -1 where a neighbour is off the board.
+
+        Columns are left, right, up, down; bots pick a column per row to move.
+        """
+        cells = np.asarray(cells, dtype=np.intp)
+        xs, ys = cells % self.width, cells // self.width
+        return np.stack([
+            np.where(xs > 0, cells - 1, -1),
+            np.where(xs < self.width - 1, cells + 1, -1),
+            np.where(ys > 0, cells - self.width, -1),
+            np.where(ys < self.height - 1, cells + self.width, -1),
+        ], axis=1)
+
+    def step_batch(self, hiders, seekers, hider_moves, targets, catch_distance=1):
+        """Play one move in many games at once.
+
+        `hider_moves[i]` says whether game i's hider or seeker moves to
+        `targets[i]`. Illegal moves leave that game unchanged. Returns the
+        new hider and seeker cells, which moves were legal, the distances
+        after the moves and which games ended (distance <= catch_distance).
+        """
+        hiders = np.asarray(hiders, dtype=np.intp)
+        seekers = np.asarray(seekers, dtype=np.intp)
+        hider_moves = np.asarray(hider_moves, dtype=bool)
+        targets = np.asarray(targets, dtype=np.intp)
+
+        legal = self.move_batch(np.where(hider_moves, hiders, seekers), targets)
+        hiders = np.where(legal & hider_moves, targets, hiders)
+        seekers = np.where(legal & ~hider_moves, targets, seekers)
+        distances = self.distance_batch(hiders, seekers)
+        return hiders, seekers, legal, distances, distances <= catch_distance
@@ -0,0 +1,190 @@
+"""Check that Socket.IO fan-out per move stays constant as concurrent matches grow.
+
+For every match count, starts that many matches (a hider and a seeker socket
+each), places both players and plays `--moves` alternating moves per match,
+then counts the state messages all sockets received during the movement phase.
+With room-scoped emits every move reaches exactly the two players of its
+match; with broadcasts it would reach every connected socket. Bytes per move
+and the time a client takes to apply a delta are reported as well.
+
+    python load_test.py --url http://127.0.0.1:5001 --matches 1 10 50 --moves 20
+
+With several `--url`s (server processes sharing a state backend), the two
+players of a match enter through different processes; each socket then
+connects to the process /join sent it to.
+"""
+import argparse
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import socketio
+
+
+class Player:
+    def __init__(self, url, player_type, counter, match_id=None):
+        self.player_type = player_type
+        self.updated = threading.Event()
+        self.state = {}
+        self.seq = 0
+        self.gaps = 0
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('state_delta', self.on_delta)
+        self.sio.on('state_snapshot', self.on_snapshot)
+        self.sio.on('game_end', self.on_snapshot)
+        self._counter = counter
+
+        params = {'match': match_id} if match_id else {}
+        response = requests.get(f'{url}/join/{player_type}', params=params, headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        self.match_id, self.token = response.json()['match_id'], response.json()['token']
+        final = urlsplit(response.url)
+        self.url = f'{final.scheme}://{final.netloc}'
+        self.sio.connect(self.url, transports=['websocket'])
+
+    def on_delta(self, delta):
+        started = time.perf_counter()
+        if delta['seq'] != self.seq + 1:
+            self.gaps += 1
+            self.sio.emit('snapshot_request', '{}')
+        else:
+            self.seq = delta['seq']
+            self.state.update(delta['changes'])
+            for key in delta['removed']:
+                self.state.pop(key, None)
+        self._counter.add(len(json.dumps(delta)), time.perf_counter() - started)
+        self.updated.set()
+
+    def on_snapshot(self, snapshot):
+        started = time.perf_counter()
+        self.seq = snapshot.get('seq', self.seq)
+        self.state = dict(snapshot.get('state', snapshot))
+        self._counter.add(len(json.dumps(snapshot)), time.perf_counter() - started)
+        self.updated.set()
+
+    def emit(self, event, **data):
+        self.updated.clear()
+        self.sio.emit(event, json.dumps(dict(data, player_type=self.player_type)))
+        if not self.updated.wait(10):
+            raise RuntimeError(f'No update for {event} in match {self.match_id}')
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.bytes = 0
+        self.apply_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, size, seconds):
+        with self._lock:
+            self.value += 1
+            self.bytes += size
+            self.apply_seconds += seconds
+
+
+def walk(moves):
+    """(player_type, x, y) of `moves` legal alternating moves from the placements below.
+
+    The hider steps between (0, 0) and (1, 0), the seeker between (5, 5) and
+    (4, 5), so both stay far apart and the game never ends during the test.
+    """
+    for i in range(moves):
+        step = (i // 2 + 1) % 2
+        yield ('hider', step, 0) if i % 2 == 0 else ('seeker', 5 - step, 5)
+
+
+def play_match(hider, seeker, moves, ready, accepted, errors):
+    players = {'hider': hider, 'seeker': seeker}
+    try:
+        hider.emit('join', token=hider.token)
+        seeker.emit('join', token=seeker.token)
+        hider.emit('placed', position={'x': 0, 'y': 0})
+        seeker.emit('placed', position={'x': 5, 'y': 5})
+        ready.wait()
+        for player_type, x, y in walk(moves):
+            player = players[player_type]
+            player.emit('move', position={'x': x, 'y': y})
+            # A rejected move is answered with a snapshot that still has the turn.
+            if player.state.get('current_turn') != player_type:
+                accepted.append(1)
+    except Exception as e:
+        errors.append(str(e))
+
+
+def run(urls, matches, moves):
+    if isinstance(urls, str):
+        urls = [urls]
+    counter = Counter()
+    pairs = []
+    for i in range(matches):
+        hider = Player(urls[i % len(urls)], 'hider', counter)
+        pairs.append((hider, Player(urls[(i + 1) % len(urls)], 'seeker', counter, hider.match_id)))
+
+    ready_event = threading.Event()
+    accepted, errors = [], []
+    threads = [threading.Thread(target=lambda h=h, s=s: play_match(h, s, moves, ready_event, accepted, errors))
+               for h, s in pairs]
+    for thread in threads:
+        thread.start()
+
+    # Let every match finish joining and placing before counting the movement phase.
+    time.sleep(1.0 + matches * 0.02)
+    before, bytes_before, seconds_before = counter.value, counter.bytes, counter.apply_seconds
+    started = time.perf_counter()
+    ready_event.set()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.5)  # let in-flight messages arrive
+    elapsed = time.perf_counter() - started
+    received = counter.value - before
+    received_bytes = counter.bytes - bytes_before
+    apply_seconds = counter.apply_seconds - seconds_before
+
+    for hider, seeker in pairs:
+        hider.sio.disconnect()
+        seeker.sio.disconnect()
+
+    # Only moves the server accepted count; a rejected one is not a move.
+    total_moves = len(accepted)
+    return {
+        'matches': matches,
+        'sockets': 2 * matches,
+        'moves': total_moves,
+        'rejected_moves': matches * moves - total_moves,
+        'messages': received,
+        'messages_per_move': received / total_moves if total_moves else None,
+        'bytes_per_move': received_bytes / total_moves if total_moves else None,
+        'apply_us_per_message': apply_seconds / received * 1e6 if received else None,
+        'gaps': sum(hider.gaps + seeker.gaps for hider, seeker in pairs),
+        'split_matches': sum(hider.url != seeker.url for hider, seeker in pairs),
+        'moves_per_second': total_moves / elapsed,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', nargs='+', default=['http://127.0.0.1:5001'])
+    parser.add_argument('--matches', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--moves', type=int, default=20, help='moves per match')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rows = []
+    for matches in args.matches:
+        row = run(args.url, matches, args.moves)
+        rows.append(row)
+        print(f"matches={matches:<5} sockets={row['sockets']:<5} moves={row['moves']:<6} rejected={row['rejected_moves']:<4} messages={row['messages']:<7} "
+              f"per move={row['messages_per_move'] or 0:.2f} bytes/move={row['bytes_per_move'] or 0:.1f} "
+              f"apply={row['apply_us_per_message']:.1f}us gaps={row['gaps']} moves/s={row['moves_per_second']:.1f} errors={len(row['errors'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import contextlib
+import secrets
+import time
+import uuid
+
+from backends import MemoryBackend
+from board import Board
+
+
+# Fields every player of a match sees; positions are only ever sent to their owner.
+# Positions are stored as board cells (see board.py) and sent as {"x", "y"}.
+public_fields = ("phase", "current_turn", "distance", "hider_connected", "seeker_connected")
+
+
+def new_game_state():
+    return {
+        "phase": "placement",
+        "positions": {},
+        "current_turn": "hider",
+        "distance": None,
+        "hider_connected": False,
+        "seeker_connected": False
+    }
+
+
+changes_sentinel = object()
+
+
+def view_for(state, player_type, board):
+    """The part of a match's state one player may see."""
+    view = {field: state[field] for field in public_fields}
+    if player_type in state["positions"]:
+        view["position"] = board.decode(state["positions"][player_type])
+    return view
+
+
+def diff(old, new):
+    """Fields of `new` that differ from `old`, and the fields `old` had that `new` lacks."""
+    changes = {key: value for key, value in new.items() if old.get(key, changes_sentinel) != value}
+    removed = [key for key in old if key not in new]
+    return changes, removed
+
+
+class MatchStore:
+    """Game state of every match, keyed by match id; a match is also its Socket.IO room.
+
+    Players receive versioned deltas of their own view of the state (see
+    `updates`), each with a per-recipient sequence number, and a full
+    `snapshot` when they report a gap.
+
+    Everything is kept in a backend (see backends.py) under these keys, so
+    several server processes can share matches:
+
+    - `match:<id>`: {"state", "players": {player_type: sid}, "views": {sid: [seq, last view sent]}}
+    - `session:<sid>`: [match_id, player_type]
+    - `reserved`: {match_id: {player_type: [expiry, token]}}, oldest first
+    - `ticket:<token>`: [match_id, player_type]
+
+    /join hands out a role with a random token, and a socket joins with that
+    token, never with a match id and role of its own choosing; a role that is
+    connected is not handed out or joined again. A role is held for
+    `reservation_ttl` seconds until its socket connects; while connected its
+    expiry is None, and it is held again for `reservation_ttl` once it
+    disconnects, so a reload with the same token comes back to it. A match is
+    dropped by the next `assign` once all its roles expired.
+
+    A match document is only read and written while holding its lock; lock
+    order is a match before `reserved`.
+    """
+
+    def __init__(self, backend=None, board=None, reservation_ttl=60):
+        self.backend = backend or MemoryBackend()
+        self.board = board or Board()
+        self.reservation_ttl = reservation_ttl
+
+    @contextlib.contextmanager
+    def _match(self, match_id):
+        """Lock a match and yield its document (None if unknown); it is saved on exit unless dropped."""
+        key = f"match:{match_id}"
+        with self.backend.lock(key):
+            match = self.backend.get(key)
+            yield match
+            if match:
+                self.backend.set(key, match)
+
+    @contextlib.contextmanager
+    def play(self, sid):
+        """Lock the match of a joined socket and yield (match_id, player_type, state) to change it."""
+        match_id, player_type = self.backend.get(f"session:{sid}") or (None, None)
+        with self._match(match_id) as match:
+            yield match_id, player_type, match["state"] if match else None
+
+    def assign(self, player_type, match_id=None, token=None):
+        """Hand out a role of `player_type` and return (match_id, token), or (None, None) if it cannot be had.
+
+        `token` from an earlier assign gets the same role back while it is not
+        connected. Otherwise the role is taken in `match_id`, which has to
+        exist with that role free, or in the oldest match with it free, or in
+        a new match.
+        """
+        now = time.time()
+        with self.backend.lock("reserved"):
+            reserved = self._expire(self.backend.get("reserved") or {}, now)
+            ticket = self.backend.get(f"ticket:{token}") if token else None
+            if ticket is not None and ticket[1] == player_type and match_id in (None, ticket[0]):
+                held = reserved.get(ticket[0], {}).get(player_type)
+                if held is not None and held[0] is not None:
+                    held[0] = now + self.reservation_ttl
+                    self.backend.set("reserved", reserved)
+                    return ticket[0], token
+
+            if match_id is not None:
+                if player_type in reserved.get(match_id, {player_type: None}):
+                    return None, None
+            else:
+                match_id = next((m for m, taken in reserved.items() if player_type not in taken), None)
+            if match_id is None:
+                match_id = uuid.uuid4().hex[:8]
+                self.backend.set(f"match:{match_id}", {"state": new_game_state(), "players": {}, "views": {}})
+                reserved[match_id] = {}
+            token = secrets.token_urlsafe(16)
+            reserved[match_id][player_type] = [now + self.reservation_ttl, token]
+            self.backend.set(f"ticket:{token}", [match_id, player_type])
+            self.backend.set("reserved", reserved)
+            return match_id, token
+
+    def _expire(self, reserved, now):
+        """Free the roles of `reserved` whose hold ran out and drop the matches left with none; called holding its lock.
+
+        Nobody is connected to a dropped match, so its document is deleted
+        without taking the match lock; a `connect` racing with it finds the
+        match gone from `reserved` and gives up.
+        """
+        for match_id, taken in list(reserved.items()):
+            for player_type, (expiry, token) in list(taken.items()):
+                if expiry is not None and expiry <= now:
+                    del taken[player_type]
+                    self.backend.delete(f"ticket:{token}")
+            if not taken:
+                del reserved[match_id]
+                self.backend.delete(f"match:{match_id}")
+        return reserved
+
+    def _hold(self, match_id, player_type, expiry, token=None):
+        """Set the expiry of a role (None while connected), if held by `token` when given.
+
+        Returns None if the match is no longer reserved, and False if the
+        token does not hold the role or the role is already connected.
+        """
+        with self.backend.lock("reserved"):
+            reserved = self.backend.get("reserved") or {}
+            if match_id not in reserved:
+                return None
+            held = reserved[match_id].get(player_type)
+            if held is None or token not in (None, held[1]) or (expiry is None and held[0] is None):
+                return False
+            held[0] = expiry
+            self.backend.set("reserved", reserved)
+            return True
+
+    def connect(self, sid, token):
+        """Join a socket to the role `token` holds; returns its match id, or None if the token holds no free role."""
+        match_id, player_type = (self.backend.get(f"ticket:{token}") if token else None) or (None, None)
+        with self._match(match_id) as match:
+            if match is None:
+                return None
+            held = self._hold(match_id, player_type, None, token)
+            if held is None:
+                match.clear()
+            if not held:
+                return None
+            match["state"][f"{player_type}_connected"] = True
+            match["players"][player_type] = sid
+            match["views"][sid] = [0, {}]
+            self.backend.set(f"session:{sid}", [match_id, player_type])
+            return match_id
+
+    def updates(self, match_id):
+        """Return (sid, delta) for every player of the match whose view changed since the last delta sent to it."""
+        with self._match(match_id) as match:
+            if match is None:
+                return []
+            deltas = []
+            for player_type, sid in match["players"].items():
+                seq, old = match["views"][sid]
+                new = view_for(match["state"], player_type, self.board)
+                changes, removed = diff(old, new)
+                if changes or removed:
+                    match["views"][sid] = [seq + 1, new]
+                    deltas.append((sid, {"seq": seq + 1, "changes": changes, "removed": removed}))
+            return deltas
+
+    def sids(self, match_id):
+        match = self.backend.get(f"match:{match_id}")
+        return list(match["players"].values()) if match else []
+
+    def snapshot(self, sid):
+        """The full current view of a player, at the sequence number of the last delta it was sent."""
+        match_id, player_type = self.backend.get(f"session:{sid}") or (None, None)
+        with self._match(match_id) as match:
+            if match is None or sid not in match["views"]:
+                return None
+            seq, _ = match["views"][sid]
+            view = view_for(match["state"], player_type, self.board)
+            match["views"][sid] = [seq, view]
+            return {"seq": seq, "state": view}
+
+    def session(self, sid):
+        """Return (match_id, player_type, state) for a joined socket, or (None, None, None)."""
+        match_id, player_type = self.backend.get(f"session:{sid}") or (None, None)
+        match = self.backend.get(f"match:{match_id}")
+        return match_id, player_type, match["state"] if match else None
+
+    def disconnect(self, sid):
+        """Forget a socket; its role stays reserved for `reservation_ttl` seconds in case it comes back."""
+        match_id, player_type = self.backend.get(f"session:{sid}") or (None, None)
+        self.backend.delete(f"session:{sid}")
+        with self._match(match_id) as match:
+            if match is None:
+                return None, None
+            state = match["state"]
+            match["views"].pop(sid, None)
+            if match["players"].get(player_type) == sid:
+                del match["players"][player_type]
+                state[f"{player_type}_connected"] = False
+                self._hold(match_id, player_type, time.time() + self.reservation_ttl)
+            return match_id, state
+
+    def finish(self, match_id):
+        with self._match(match_id) as match:
+            if match is not None:
+                self._drop(match_id, match)
+
+    def _drop(self, match_id, match):
+        """Delete a match whose lock is held; clearing the document keeps `_match` from saving it again."""
+        self.backend.delete(f"match:{match_id}", *(f"session:{sid}" for sid in match["players"].values()))
+        with self.backend.lock("reserved"):
+            reserved = self.backend.get("reserved") or {}
+            taken = reserved.pop(match_id, {})
+            self.backend.delete(*(f"ticket:{token}" for _, token in taken.values()))
+            self.backend.set("reserved", reserved)
+        match.clear()
+
+    def __len__(self):
+        return len(self.backend.get("reserved") or {})
@@ -0,0 +1,52 @@
+"""Prometheus metrics of the Socket.IO game server, served on /metrics.
+
+Every process exports its own numbers; with several workers (see
+backends.py) Prometheus scrapes each of them and sums on its side.
+
+Logging goes through `logging` at LOG_LEVEL (default WARNING); handlers pass
+their arguments unformatted, so a disabled debug line costs no string work.
+"""
+import functools
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+latency_buckets = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+request_seconds = Histogram('hns_http_request_seconds', 'Time to handle an HTTP request',
+                            ['route', 'method', 'status'], buckets=latency_buckets)
+event_seconds = Histogram('hns_socketio_event_seconds', 'Time to handle a Socket.IO event', ['event'],
+                          buckets=latency_buckets)
+moves = Counter('hns_moves_total', 'Move and placement events, by outcome', ['event', 'outcome'])
+message_bytes = Counter('hns_state_message_bytes_total', 'JSON bytes of state messages sent', ['event'])
+connections = Gauge('hns_socketio_connections', 'Open Socket.IO connections of this process')
+matches = Gauge('hns_matches', 'Matches in the state backend')
+
+
+def configure_logging():
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+def timed_event(event):
+    """Decorate a Socket.IO handler to record its latency under `event`."""
+    histogram = event_seconds.labels(event)
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def exposition():
+    """Return (body, content type) of the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
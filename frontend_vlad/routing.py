@@ -0,0 +1,23 @@
+"""Sticky routing of matches to server processes.
+
+Socket.IO needs every request of one socket (long-polling included) to reach
+the same process, and a match is cheapest when both of its players are on the
+same process, since its events then never cross the message queue. Each match
+is therefore owned by one worker, picked by rendezvous hashing of its id over
+the WORKERS list, and /join redirects players to the owner. The page connects
+its socket to its own origin, so the socket stays on that worker too.
+Adding or removing a worker only moves the matches it owned.
+"""
+import hashlib
+
+
+def parse_workers(value):
+    """WORKERS is a comma-separated list of base URLs, e.g. `http://10.0.0.1:5001,http://10.0.0.2:5001`."""
+    return [url.strip().rstrip("/") for url in (value or "").split(",") if url.strip()]
+
+
+def owner(match_id, workers):
+    """The worker that serves a match, or None when there is no worker list."""
+    if not workers:
+        return None
+    return max(workers, key=lambda worker: hashlib.sha1(f"{worker}|{match_id}".encode()).digest())
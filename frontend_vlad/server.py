@@ -1,10 +1,30 @@
 import json
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit
+import logging
+import os
+import time
+from flask import Flask, Response, g, jsonify, make_response, redirect, render_template, request
+from flask_socketio import SocketIO, emit, join_room
 from flask_talisman import Talisman
+from backends import backend_from_url, message_queue_url
+from board import Board
+from matches import MatchStore
+import metrics
+from routing import owner, parse_workers
+
+# STATE_BACKEND=redis://... shares matches between server processes, and the
+# Socket.IO message queue (MESSAGE_QUEUE, or the same Redis) fans events out
+# between them. WORKERS lists every process so /join can route each match to
+# one of them; WORKER_URL is this process's own entry in that list.
+state_backend_url = os.environ.get('STATE_BACKEND', 'memory://')
+workers = parse_workers(os.environ.get('WORKERS'))
+worker_url = os.environ.get('WORKER_URL', '').rstrip('/')
+
+metrics.configure_logging()
+log = logging.getLogger('server')
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", transports=['websocket', 'polling'])
+socketio = SocketIO(app, cors_allowed_origins="*", transports=['websocket', 'polling'],
+                    message_queue=message_queue_url(state_backend_url))
 
 csp = {
     'default-src': [
@@ -43,39 +63,90 @@ csp = {
 
 Talisman(app, content_security_policy=csp)
 
-game_state = {
-    'hider_connected': False,
-    'seeker_connected': False,
-    'phase': 'placement',
-    'current_turn': 'hider',
-    'positions': {},
-    'distance': None
-}
-
-def calculate_distance(hider_pos, seeker_pos):
-    dx = abs(hider_pos['x'] - seeker_pos['x'])
-    dy = abs(hider_pos['y'] - seeker_pos['y'])
-    return dx + dy
+# The server decides which moves are legal; the board is 6x6 unless BOARD_WIDTH/BOARD_HEIGHT say otherwise.
+board = Board(int(os.environ.get('BOARD_WIDTH', 6)), int(os.environ.get('BOARD_HEIGHT', 6)))
+
+# Every match has its own state and is its own Socket.IO room, so an update
+# only reaches the two players of that match.
+backend = backend_from_url(state_backend_url)
+matches = MatchStore(backend, board, reservation_ttl=float(os.environ.get('RESERVATION_TTL', 60)))
+metrics.matches.set_function(lambda: len(matches))
+
+# Size of the state messages sent, to compare bytes per move across protocol
+# changes; kept in the backend so /stats covers every process.
+message_stats = ('moves', 'messages', 'bytes')
+
+def push_state(match_id):
+    """Send each player of the match the delta of its own view, if it changed."""
+    for sid, delta in matches.updates(match_id):
+        size = len(json.dumps(delta))
+        backend.incr('messages')
+        backend.incr('bytes', size)
+        metrics.message_bytes.labels('state_delta').inc(size)
+        emit('state_delta', delta, to=sid)
+
+def reject(event, outcome, message):
+    """Tell the sender its move was not taken and resend its view, so the client undoes what it drew."""
+    metrics.moves.labels(event, outcome).inc()
+    emit("error", {"message": message})
+    snapshot = matches.snapshot(request.sid)
+    if snapshot is not None:
+        emit('state_snapshot', snapshot)
+
+def end_match(match_id):
+    for sid in matches.sids(match_id):
+        snapshot = matches.snapshot(sid)
+        if snapshot is not None:
+            metrics.message_bytes.labels('game_end').inc(len(json.dumps(snapshot['state'])))
+            emit('game_end', snapshot['state'], to=sid)
+    matches.finish(match_id)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.request_seconds.labels(route, request.method, response.status_code).observe(time.perf_counter() - g.started)
+    return response
 
 @app.route('/')
 def index():
-    # Reset game state to initial values
-    global game_state
-    game_state = {
-        "phase": "placement",
-        "positions": {},
-        "current_turn": "hider",
-        "distance": None,
-        "hider_connected": False,
-        "seeker_connected": False
-    }
     return render_template('index.html')
 
 @app.route('/join/<player_type>')
 def join_game(player_type):
     if player_type not in ['hider', 'seeker']:
         return 'Invalid player type', 400
-    return render_template('game.html', player_type=player_type)
+    # The cookie keeps this browser's token for the role, so a reload rejoins its match.
+    cookie = f'{player_type}_token'
+    match_id, token = matches.assign(player_type, request.args.get('match'),
+                                     request.args.get('token') or request.cookies.get(cookie))
+    if match_id is None:
+        return f'No free {player_type} in that match', 409
+    target = owner(match_id, workers)
+    if target is not None and target != worker_url:
+        return redirect(f'{target}/join/{player_type}?token={token}')
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        response = jsonify(match_id=match_id, player_type=player_type, token=token)
+    else:
+        response = make_response(render_template('game.html', player_type=player_type, match_id=match_id, token=token,
+                                                 board_width=board.width, board_height=board.height))
+    response.set_cookie(cookie, token, max_age=3600, httponly=True, samesite='Lax')
+    return response
+
+@app.route('/stats')
+def stats():
+    counters = backend.counters(*message_stats)
+    moves = counters['moves']
+    return jsonify(dict(counters, matches=len(matches), worker=worker_url or None,
+                        bytes_per_move=counters['bytes'] / moves if moves else None))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
 
 @app.route('/game-over')
 def game_over():
@@ -84,9 +155,19 @@ def game_over():
 
 @socketio.on('connect')
 def handle_connect():
-    print("[DEBUG] Client connected")
+    metrics.connections.inc()
+    log.debug("Client %s connected", request.sid)
+
+@socketio.on('disconnect')
+@metrics.timed_event('disconnect')
+def handle_disconnect():
+    metrics.connections.dec()
+    match_id, game_state = matches.disconnect(request.sid)
+    if game_state is not None:
+        push_state(match_id)
 
 @socketio.on('join')
+@metrics.timed_event('join')
 def handle_join(data):
     """Ensure data is properly parsed as a dictionary"""
     if isinstance(data, str):  
@@ -96,100 +177,136 @@ def handle_join(data):
             
             return emit("error", {"message": "Invalid JSON format"})
 
-    if not isinstance(data, dict) or "player_type" not in data:
+    if not isinstance(data, dict) or "token" not in data:
         
-        return emit("error", {"message": "Missing player_type"})
+        return emit("error", {"message": "Missing token"})
 
-    player_type = data["player_type"]
+    # The token from /join decides the match and role, not anything else the client sends.
+    match_id = matches.connect(request.sid, data["token"])
+    if match_id is None:
+        return emit("error", {"message": "Unknown or already connected role"})
+    join_room(match_id)
 
-    if player_type not in ["hider", "seeker"]:
-        print(f"[DEBUG] Invalid player type: {player_type}")
-        return emit("error", {"message": "Invalid player type"})
+    push_state(match_id)
 
-    game_state[f"{player_type}_connected"] = True
-    
-
-    emit("game_state_update", {
-        "phase": game_state["phase"],
-        "current_turn": game_state["current_turn"],
-        "hider_connected": game_state["hider_connected"],
-        "seeker_connected": game_state["seeker_connected"]
-    }, broadcast=True)
-
-import json
+@socketio.on('snapshot_request')
+@metrics.timed_event('snapshot_request')
+def handle_snapshot_request(data=None):
+    """A client that saw a gap in the delta sequence asks for its full view."""
+    snapshot = matches.snapshot(request.sid)
+    if snapshot is None:
+        return emit("error", {"message": "Not in a match"})
+    emit('state_snapshot', snapshot)
 
 @socketio.on('placed')
+@metrics.timed_event('placed')
 def handle_placed(data):
     """Handle player moves and transition game state when needed."""
-    print(f"[DEBUG] Received placed data: {data}")
+    log.debug("Received placed data: %s", data)
 
     if isinstance(data, str):
         try:
             data = json.loads(data)
         except json.JSONDecodeError:
-            print("[ERROR] Received invalid JSON in 'placed' event")
+            log.warning("Received invalid JSON in 'placed' event")
             return
 
-    if not isinstance(data, dict) or "player_type" not in data or "position" not in data:
-        print("[ERROR] Invalid placed data format.")
-        return
-
-    if game_state["phase"] != "placement":
-        print("[DEBUG] Not in placement phase, ignoring placed event.")
+    if not isinstance(data, dict) or "position" not in data:
+        log.warning("Invalid placed data format.")
         return
 
-    player_type = data["player_type"]
-    position = data["position"]
-
-    print(f"[DEBUG] {player_type} placed at {position}")
-
-    game_state["positions"][player_type] = position
+    # The match and role come from the socket's join, not from the message.
+    # The match stays locked while it changes, so processes sharing it do not race.
+    # A rejection is answered after the lock is released, since the snapshot takes it again.
+    rejection = None
+    with matches.play(request.sid) as (match_id, player_type, game_state):
+        if game_state is None:
+            log.warning("Placed event from a socket that has not joined a match.")
+            return emit("error", {"message": "Not in a match"})
+
+        cell = board.encode(data["position"])
+        if game_state["phase"] != "placement":
+            rejection = ('wrong_phase', "Not in the placement phase")
+        elif cell is None:
+            rejection = ('illegal', "Position is off the board")
+        else:
+            log.debug("%s placed at %s in match %s", player_type, data['position'], match_id)
+            place(game_state, player_type, cell)
+
+    if rejection is not None:
+        log.debug("Rejected placement %s from %s: %s", data['position'], player_type, rejection[0])
+        return reject('placed', *rejection)
+    metrics.moves.labels('placed', 'accepted').inc()
+    push_state(match_id)
+
+def place(game_state, player_type, cell):
+    """Record a starting cell; movement starts once both players have one."""
+    game_state["positions"][player_type] = cell
     if ('hider' in game_state['positions'] and 'seeker' in game_state['positions']):
         game_state["phase"] = "movement"
-        print("[DEBUG] Transitioning to movement phase.")
+        log.debug("Placement done, transitioning to movement phase.")
 
     if game_state["phase"] == "movement":
-        game_state["distance"] = calculate_distance(game_state["positions"]["hider"], game_state["positions"]["seeker"])
-
-    emit('game_state_update', game_state, broadcast=True)
+        game_state["distance"] = board.distance(game_state["positions"]["hider"], game_state["positions"]["seeker"])
 
 @socketio.on('move')
+@metrics.timed_event('move')
 def handle_move(data):
     """Handle player moves and transition game state when needed."""
-    print(f"[DEBUG] Received move data: {data}")
+    log.debug("Received move data: %s", data)
 
     if isinstance(data, str):
         try:
             data = json.loads(data)
         except json.JSONDecodeError:
-            print("[ERROR] Received invalid JSON in 'move' event")
+            log.warning("Received invalid JSON in 'move' event")
             return
 
-    if not isinstance(data, dict) or "player_type" not in data or "position" not in data:
-        print("[ERROR] Invalid move data format.")
+    if not isinstance(data, dict) or "position" not in data:
+        log.warning("Invalid move data format.")
         return
-    
-    if game_state["phase"] != "movement":
-        print("[DEBUG] Not in movement phase, ignoring move event.")
-        return
-
-    player_type = data["player_type"]
-    position = data["position"]
 
-    print(f"[DEBUG] {player_type} moved to {position}")
+    rejection = None
+    with matches.play(request.sid) as (match_id, player_type, game_state):
+        if game_state is None:
+            log.warning("Move event from a socket that has not joined a match.")
+            return emit("error", {"message": "Not in a match"})
+
+        cell = board.encode(data["position"])
+        if game_state["phase"] != "movement":
+            rejection = ('wrong_phase', "Not in the movement phase")
+        elif game_state["current_turn"] != player_type:
+            rejection = ('out_of_turn', "Not your turn")
+        elif cell is None or not board.is_adjacent(game_state["positions"][player_type], cell):
+            rejection = ('illegal', "Illegal move")
+        else:
+            log.debug("%s moved to %s in match %s", player_type, data['position'], match_id)
+            move(game_state, player_type, cell)
+
+    if rejection is not None:
+        log.debug("Rejected move %s from %s: %s", data['position'], player_type, rejection[0])
+        return reject('move', *rejection)
+
+    backend.incr('moves')
+    metrics.moves.labels('move', 'accepted').inc()
+
+    if game_state["phase"] == "end":
+        end_match(match_id)
+        log.info("Match %s over.", match_id)
+    else:
+        push_state(match_id)
 
-    game_state["positions"][player_type] = position
+def move(game_state, player_type, cell):
+    """Apply a legal move and pass the turn; the match ends once the players are adjacent."""
+    game_state["positions"][player_type] = cell
     game_state["current_turn"] = "seeker" if player_type == "hider" else "hider"
-    game_state["distance"] = calculate_distance(game_state["positions"]["hider"], game_state["positions"]["seeker"])
+    game_state["distance"] = board.distance(game_state["positions"]["hider"], game_state["positions"]["seeker"])
 
-    print(f"[DEBUG] Distance: {game_state['distance']}")
+    log.debug("Distance: %s", game_state['distance'])
     if game_state["distance"] <= 1:
         game_state["phase"] = "end"
-        print("[DEBUG] Transitioning to end phase.")
-        emit('game_end', game_state, broadcast=True)
-        print("[DEBUG] Game over.")
-    else:
-        emit('game_state_update', game_state, broadcast=True)
+        log.debug("Distance %s, transitioning to end phase.", game_state['distance'])
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5001, debug=True)
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)),
+                 debug=os.environ.get('DEBUG', '1') == '1', allow_unsafe_werkzeug=True)
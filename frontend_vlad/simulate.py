@@ -0,0 +1,317 @@
+"""Headless Socket.IO game simulator: thousands of scripted hiders and seekers.
+
+Starts `server.py` as local worker processes (see bench_scaling.py), or uses
+the ones given with `--url`, and plays matches back to back with asyncio
+Socket.IO clients speaking the same `join`/`placed`/`move` protocol as the
+browser. Hiders walk at random; seekers walk towards their hider most of the
+time, so matches end and new ones start throughout the run.
+
+Turn latency is the time from a player emitting `move` until its own state
+delta shows the turn passed on (or the match ended). Reported per run:
+moves/sec, turn latency p50/p95/p99, and the average and peak CPU and peak
+resident memory of the server processes.
+
+With `--offline` no server is started: every match is played in lockstep in
+this process, one NumPy batch per turn (`Board.step_batch` validates and
+applies all moves at once), which measures the game rules alone.
+
+    python simulate.py --agents 1000 4000 --duration 60
+    python simulate.py --processes 4 --state redis://127.0.0.1:6379/0 --agents 4000
+    python simulate.py --offline --agents 100000 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import aiohttp
+import numpy as np
+import psutil
+import socketio
+
+from bench_scaling import start_workers, stop_workers
+from board import Board
+
+
+class Agent:
+    def __init__(self, player_type):
+        self.player_type = player_type
+        self.state = {}
+        self.seq = 0
+        self.changed = asyncio.Event()
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on('state_delta', self.on_delta)
+        self.sio.on('state_snapshot', self.on_snapshot)
+        self.sio.on('game_end', self.on_game_end)
+
+    async def connect(self, session, url, match_id=None):
+        """Take a role through /join (in `match_id` if given) and join its match; returns the match id."""
+        params = {'match': match_id} if match_id else {}
+        async with session.get(f'{url}/join/{self.player_type}', params=params,
+                               headers={'Accept': 'application/json'}) as response:
+            response.raise_for_status()
+            joined = await response.json()
+        # /join may have sent us to the worker that owns the match.
+        await self.sio.connect(str(response.url.origin()), transports=['websocket'])
+        await self.emit('join', token=joined['token'])
+        return joined['match_id']
+
+    async def emit(self, event, **data):
+        await self.sio.emit(event, json.dumps(dict(data, player_type=self.player_type)))
+
+    async def on_delta(self, delta):
+        if delta['seq'] != self.seq + 1:
+            await self.sio.emit('snapshot_request', '{}')
+            return
+        self.seq = delta['seq']
+        self.state.update(delta['changes'])
+        for key in delta['removed']:
+            self.state.pop(key, None)
+        self.changed.set()
+
+    async def on_snapshot(self, snapshot):
+        self.seq = snapshot['seq']
+        self.state = snapshot['state']
+        self.changed.set()
+
+    async def on_game_end(self, state):
+        self.state = dict(state, phase='end')
+        self.changed.set()
+
+    async def wait_for(self, predicate, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not predicate(self.state):
+            self.changed.clear()
+            await asyncio.wait_for(self.changed.wait(), max(0.0, deadline - time.monotonic()))
+
+
+class Stats:
+    def __init__(self):
+        self.turns = []
+        self.matches = 0
+        self.errors = 0
+
+    def report(self, elapsed):
+        turns = sorted(self.turns)
+
+        def percentile(p):
+            return turns[min(len(turns) - 1, int(len(turns) * p))] * 1000 if turns else None
+
+        return {
+            'moves': len(turns),
+            'moves_per_second': len(turns) / elapsed,
+            'matches_finished': self.matches,
+            'errors': self.errors,
+            'turn_p50_ms': percentile(0.50),
+            'turn_p95_ms': percentile(0.95),
+            'turn_p99_ms': percentile(0.99),
+        }
+
+
+class ResourceSampler:
+    """CPU and resident memory of the server processes, summed, every `interval` seconds on a thread."""
+
+    def __init__(self, pids, interval=0.5):
+        self.processes = [psutil.Process(pid) for pid in pids]
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        if not self.processes:
+            return
+        for process in self.processes:
+            process.cpu_percent(None)
+        while not self._stopped.wait(self.interval):
+            self.cpu.append(sum(process.cpu_percent(None) for process in self.processes))
+            self.rss.append(sum(process.memory_info().rss for process in self.processes))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def report(self):
+        return {
+            'cpu_avg_percent': sum(self.cpu) / len(self.cpu) if self.cpu else None,
+            'cpu_max_percent': max(self.cpu, default=None),
+            'rss_max_mb': max(self.rss) / 2 ** 20 if self.rss else None,
+        }
+
+
+def next_cell(board, rng, cell, towards=None):
+    """A random legal step from `cell`, or the step closest to `towards` when given."""
+    steps = [int(step) for step in board.neighbours([cell])[0] if step >= 0]
+    if towards is None:
+        return rng.choice(steps)
+    return min(steps, key=lambda step: board.distance(step, towards))
+
+
+def place_batch(board, rng, matches):
+    """Random starting cells for `matches` games, the seeker always more than one step from the hider."""
+    hiders = rng.integers(board.cells, size=matches)
+    seekers = rng.integers(board.cells, size=matches)
+    close = board.distance_batch(hiders, seekers) <= 1
+    while close.any():
+        seekers[close] = rng.integers(board.cells, size=int(close.sum()))
+        close = board.distance_batch(hiders, seekers) <= 1
+    return hiders, seekers
+
+
+def plan_batch(board, rng, cells, towards, chasing):
+    """`next_cell` for many games: a random legal step, or the one closest to `towards` where `chasing`."""
+    steps = board.neighbours(cells)
+    legal = steps >= 0
+    closeness = -board.distances[np.where(legal, steps, 0), towards[:, None]]
+    scores = np.where(chasing[:, None], closeness, rng.random(steps.shape))
+    scores = np.where(legal, scores, -np.inf)
+    return steps[np.arange(len(cells)), scores.argmax(axis=1)]
+
+
+def run_offline(matches, duration, board, chase, seed):
+    """Play `matches` games in lockstep without a server; a finished game is replaced by a new one."""
+    rng = np.random.default_rng(seed)
+    hiders, seekers = place_batch(board, rng, matches)
+    hider_moves = np.ones(matches, dtype=bool)
+    moves = finished = illegal = 0
+
+    started = time.monotonic()
+    deadline = started + duration
+    while time.monotonic() < deadline:
+        chasing = ~hider_moves & (rng.random(matches) < chase)
+        targets = plan_batch(board, rng, np.where(hider_moves, hiders, seekers), np.where(hider_moves, seekers, hiders),
+                             chasing)
+        hiders, seekers, legal, _, ended = board.step_batch(hiders, seekers, hider_moves, targets)
+        moves += int(legal.sum())
+        illegal += matches - int(legal.sum())
+        hider_moves = np.where(legal, ~hider_moves, hider_moves)
+
+        if ended.any():
+            finished += int(ended.sum())
+            hiders[ended], seekers[ended] = place_batch(board, rng, int(ended.sum()))
+            hider_moves[ended] = True
+
+    return {
+        'moves': moves,
+        'moves_per_second': moves / (time.monotonic() - started),
+        'matches_finished': finished,
+        'errors': illegal,
+        'turn_p50_ms': None,
+        'turn_p95_ms': None,
+        'turn_p99_ms': None,
+    }
+
+
+async def play_match(session, urls, board, rng, deadline, stats, chase):
+    hider, seeker = Agent('hider'), Agent('seeker')
+    players = {'hider': hider, 'seeker': seeker}
+    try:
+        match_id = await hider.connect(session, rng.choice(urls))
+        await seeker.connect(session, rng.choice(urls), match_id)
+
+        hider_cell = rng.randrange(board.cells)
+        seeker_cell = rng.choice([cell for cell in range(board.cells) if board.distance(cell, hider_cell) > 1])
+        await hider.emit('placed', position=board.decode(hider_cell))
+        await seeker.emit('placed', position=board.decode(seeker_cell))
+        await hider.wait_for(lambda state: state.get('phase') != 'placement')
+        await seeker.wait_for(lambda state: 'position' in state)
+
+        while time.monotonic() < deadline:
+            mover = players[hider.state['current_turn']]
+            await mover.wait_for(lambda state: state.get('current_turn') == mover.player_type)
+            cell = board.encode(mover.state['position'])
+            towards = None
+            if mover is seeker and rng.random() < chase:
+                towards = board.encode(hider.state['position'])
+            target = next_cell(board, rng, cell, towards)
+
+            started = time.perf_counter()
+            await mover.emit('move', position=board.decode(target))
+            await mover.wait_for(lambda state: state.get('phase') == 'end' or state.get('current_turn') != mover.player_type)
+            stats.turns.append(time.perf_counter() - started)
+
+            if mover.state.get('phase') == 'end':
+                stats.matches += 1
+                break
+            await hider.wait_for(lambda state: state.get('current_turn') != mover.player_type)
+    except Exception:
+        stats.errors += 1
+    finally:
+        await hider.sio.disconnect()
+        await seeker.sio.disconnect()
+
+
+async def run_agents(urls, agents, duration, board, chase, seed):
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    async def pair(index):
+        rng = random.Random(seed + index)
+        while time.monotonic() < deadline:
+            await play_match(session, urls, board, rng, deadline, stats, chase)
+
+    started = time.monotonic()
+    connector = aiohttp.TCPConnector(limit=0)
+    # No cookie jar: the agents share the session, and a /join cookie would hand one agent's role to another.
+    async with aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
+        await asyncio.gather(*(pair(index) for index in range(agents // 2)))
+    return stats.report(time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', nargs='+', help='use running servers instead of starting them')
+    parser.add_argument('--processes', type=int, default=1, help='server processes to start')
+    parser.add_argument('--state', default='memory://', help='STATE_BACKEND of the started servers')
+    parser.add_argument('--base-port', type=int, default=5101)
+    parser.add_argument('--agents', nargs='+', type=int, default=[1000], help='players per run, two per match')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds per run')
+    parser.add_argument('--chase', type=float, default=0.7, help='how often a seeker steps towards its hider')
+    parser.add_argument('--board', type=int, nargs=2, default=[6, 6], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--offline', action='store_true', help='play in this process with batched NumPy moves, no server')
+    parser.add_argument('--json', help='write results as JSON to this file')
+    args = parser.parse_args()
+    if args.processes > 1 and args.state.startswith('memory://'):
+        parser.error('several processes need a shared --state, e.g. redis://127.0.0.1:6379/0')
+    board = Board(*args.board)
+    os.environ.update(BOARD_WIDTH=str(board.width), BOARD_HEIGHT=str(board.height))
+
+    rows = []
+    for agents in args.agents:
+        workers = []
+        urls = args.url or []
+        if not urls and not args.offline:
+            urls, workers = start_workers(args.processes, args.base_port, args.state, True)
+        pids = [os.getpid()] if args.offline else [worker.pid for worker in workers]
+        try:
+            with ResourceSampler(pids) as sampler:
+                if args.offline:
+                    row = run_offline(agents // 2, args.duration, board, args.chase, args.seed)
+                else:
+                    row = asyncio.run(run_agents(urls, agents, args.duration, board, args.chase, args.seed))
+        finally:
+            stop_workers(workers)
+        row = dict(row, agents=agents, processes=len(urls), **sampler.report())
+        rows.append(row)
+        print(f"agents={agents:<6} processes={row['processes']:<2} moves/s={row['moves_per_second']:8.1f} "
+              f"turn p50={row['turn_p50_ms'] or 0:6.1f}ms p95={row['turn_p95_ms'] or 0:6.1f}ms "
+              f"p99={row['turn_p99_ms'] or 0:7.1f}ms matches={row['matches_finished']:<6} "
+              f"cpu avg={row['cpu_avg_percent'] or 0:6.1f}% max={row['cpu_max_percent'] or 0:6.1f}% "
+              f"rss={row['rss_max_mb'] or 0:7.1f}MB errors={row['errors']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
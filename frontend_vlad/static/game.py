@@ -2,19 +2,26 @@ from pyscript import document
 import json
 import js
 import asyncio
+import time
 from pyodide.ffi import create_proxy
 
 class HideAndSeekGame:
     def __init__(self):
         """Initialize the game and set up WebSockets."""
         self.player_type = document.getElementById("player_type").textContent.strip().lower()
+        self.token = document.getElementById("match_id").getAttribute("data-token")
         self.status_element = document.getElementById("gameStatus")
         self.my_position = None
         self.game_state = {"phase": "placement", "current_turn": "hider"}
         self.distance = 0
-        
-        self.on_game_state_update_proxy = create_proxy(self.on_game_state_update)
+        self.seq = 0  # sequence number of the last delta applied
+        self.parse_seconds = 0.0
+        self.messages = 0
+
+        self.on_state_delta_proxy = create_proxy(self.on_state_delta)
+        self.on_state_snapshot_proxy = create_proxy(self.on_state_snapshot)
         self.on_game_end_proxy = create_proxy(self.on_game_end)
+        self.on_error_proxy = create_proxy(self.on_error)
         self.create_board()
 
         asyncio.ensure_future(self.wait_for_socket())
@@ -28,20 +35,24 @@ class HideAndSeekGame:
         self.sio = js.window.socket 
         print("[DEBUG] Socket.IO is ready, sending join event.")
 
-        self.sio.on("game_state_update", self.on_game_state_update_proxy)
+        self.sio.on("state_delta", self.on_state_delta_proxy)
+        self.sio.on("state_snapshot", self.on_state_snapshot_proxy)
         self.sio.on("game_end", self.on_game_end_proxy)
+        self.sio.on("error", self.on_error_proxy)
         self.on_socket_connect()
 
     def on_socket_connect(self):
         """Send join event after WebSocket connection is established."""
         print(f"[DEBUG] Socket.IO connected! Sending join event with player_type: {self.player_type}")
-        self.sio.emit("join", json.dumps({"player_type": self.player_type}))
+        self.sio.emit("join", json.dumps({"token": self.token}))
 
     def create_board(self):
-        """Generate the game board dynamically inside PyScript."""
+        """Generate the game board dynamically inside PyScript; the server sets its size."""
         game_board = document.getElementById("gameBoard")
-        for y in range(6):
-            for x in range(6):
+        width = int(game_board.getAttribute("data-width") or 6)
+        height = int(game_board.getAttribute("data-height") or 6)
+        for y in range(height):
+            for x in range(width):
                 cell = document.createElement("div")
                 cell.className = "cell"
                 cell.id = f"cell_{x}_{y}"
@@ -89,25 +100,77 @@ class HideAndSeekGame:
             self.update_status("Waiting for opponent to move...")
 
 
-    def on_game_state_update(self, state):
-        """Handle updates to the game state safely."""
-        print(f"[DEBUG] Received game state update: {state}")
-
-        if hasattr(state, "to_py"):
-            state = state.to_py()
-
-        if isinstance(state, str):
+    def parse_message(self, message):
+        if hasattr(message, "to_py"):
+            message = message.to_py()
+        if isinstance(message, str):
             try:
-                state = json.loads(state)
+                message = json.loads(message)
             except json.JSONDecodeError:
-                print("[ERROR] Failed to parse JSON from game state update.")
-                return
+                print("[ERROR] Failed to parse JSON from state message.")
+                return None
+        if not isinstance(message, dict):
+            print("[ERROR] Invalid state message format received.")
+            return None
+        return message
+
+    def record_parse_time(self, started):
+        self.parse_seconds += time.perf_counter() - started
+        self.messages += 1
+        if self.messages % 20 == 0:
+            print(f"[DEBUG] Average state parse time: {self.parse_seconds / self.messages * 1000:.3f} ms over {self.messages} messages")
+
+    def on_state_delta(self, delta):
+        """Apply a delta of our view of the state; ask for a snapshot if one was missed."""
+        started = time.perf_counter()
+        delta = self.parse_message(delta)
+        if delta is None:
+            return
 
-        if not isinstance(state, dict):
-            print("[ERROR] Invalid game state format received.")
+        if delta["seq"] != self.seq + 1:
+            print(f"[DEBUG] Expected state seq {self.seq + 1}, got {delta['seq']}; requesting a snapshot.")
+            self.sio.emit("snapshot_request", "{}")
+            return
+
+        self.seq = delta["seq"]
+        self.game_state.update(delta["changes"])
+        for key in delta["removed"]:
+            self.game_state.pop(key, None)
+        self.record_parse_time(started)
+        self.render_state()
+
+    def on_state_snapshot(self, snapshot):
+        """Replace our view of the state with a full snapshot from the server."""
+        started = time.perf_counter()
+        snapshot = self.parse_message(snapshot)
+        if snapshot is None:
             return
 
-        self.game_state = state 
+        self.seq = snapshot["seq"]
+        self.game_state = snapshot["state"]
+        self.record_parse_time(started)
+        self.sync_position()
+        self.render_state()
+
+    def sync_position(self):
+        """Put our piece where the server has it, undoing a local move or placement it rejected."""
+        position = self.game_state.get("position")
+        if position == self.my_position:
+            return
+        if self.my_position:
+            self.dehighlight_position(self.my_position["x"], self.my_position["y"])
+        self.my_position = position
+        if position:
+            self.highlight_position(position["x"], position["y"])
+
+    def on_error(self, error):
+        """The server refused our last message; a snapshot of the real state follows a rejected move."""
+        error = self.parse_message(error)
+        if error is not None:
+            print(f"[DEBUG] Server error: {error.get('message')}")
+
+    def render_state(self):
+        """Show the current state to the player."""
         print(f"[DEBUG] Updated game state: {self.game_state}")
 
         hider_ready = self.game_state.get("hider_connected", False)
@@ -177,7 +240,7 @@ class HideAndSeekGame:
         self.status_element.textContent = message
 
     def is_valid_move(self, current_x, current_y, new_x, new_y):
-        """Check if the move is valid (only horizontal or vertical by 1 step)."""
+        """Check if the move is valid (only horizontal or vertical by 1 step); the server checks it again."""
         return (abs(new_x - current_x) == 1 and new_y == current_y) or \
             (abs(new_y - current_y) == 1 and new_x == current_x)
 